@@ -1,12 +1,28 @@
 import os
+import io
+import json
+import shutil
+import hashlib
 import argparse
 import time
+import numpy as np
 from PIL import Image
 import glymur
 import concurrent.futures
+import multiprocessing
 import threading
 import queue
 from tqdm import tqdm
+from jp2_profiler import WorkerProfiler, active_profiler
+from jp2_runner import TaskRunner
+from jp2_walker import walk_directory
+from jp2_prefetch import Prefetcher
+from jp2_pipeline import run_pipeline, parse_pipeline_spec, format_pipeline_stats
+from jp2_pyramid import build_pyramid, pyramid_output_path, DEFAULT_PYRAMID, TILE_SIZES, TILE_FORMATS, LAYOUTS
+from jp2_regions import decode_regions, RegionSplitPolicy, SPLIT_MODES, DEFAULT_MIN_MEGAPIXELS
+from jp2_metrics import ConversionMetrics, TextfileExporter, start_metrics_server
+from jp2_telemetry import (MemoryGovernor, read_resource_usage, usage_delta, estimate_file_memory,
+                           format_bytes, format_usage, write_report)
 
 # 创建一个全局队列用于存储转换结果
 result_queue = queue.Queue()
@@ -14,9 +30,200 @@ result_queue = queue.Queue()
 # 创建一个锁用于同步输出
 print_lock = threading.Lock()
 
-def convert_single_file(input_path, output_path, target_format, quality=None, resize=None):
+# 编码预设：在编码速度和输出体积之间权衡
+# subsampling: 0=4:4:4, 1=4:2:2, 2=4:2:0
+ENCODER_PRESETS = {
+    'fast': {
+        'png': {'compress_level': 1},
+        'jpeg': {'subsampling': 2, 'optimize': False, 'progressive': False},
+        'tiff': {'compression': None},
+        'webp': {'method': 0},
+    },
+    'balanced': {
+        'png': {'compress_level': 6},
+        'jpeg': {'subsampling': 2, 'optimize': True, 'progressive': False},
+        'tiff': {'compression': 'tiff_lzw', 'strip_size': 256 * 1024},
+        'webp': {'method': 4},
+    },
+    'small': {
+        'png': {'compress_level': 9, 'optimize': True},
+        'jpeg': {'subsampling': 2, 'optimize': True, 'progressive': True},
+        'tiff': {'compression': 'tiff_adobe_deflate', 'strip_size': 1024 * 1024},
+        'webp': {'method': 6},
+    },
+}
+
+# TIFF压缩方式（命令行名称 -> Pillow名称）
+TIFF_COMPRESSIONS = {
+    'none': None,
+    'lzw': 'tiff_lzw',
+    'deflate': 'tiff_adobe_deflate',
+    'jpeg': 'jpeg',
+}
+
+# 不经过图像编码、直接输出原始栅格的格式
+RAW_FORMATS = ['npy', 'packed']
+
+# 瓦片金字塔格式，输出为清单文件和瓦片目录
+PYRAMID_FORMAT = 'pyramid'
+
+# 打包模式下合并文件的默认文件名
+PACKED_FILENAME = 'rasters.pack'
+
+class PackedRasterWriter:
     """
-    转换单个JP2文件到指定格式
+    将解码后的栅格依次追加到同一个可内存映射的文件中
+    
+    每个栅格按ALIGNMENT字节对齐存放，关闭时写出"<打包文件>.json"索引，
+    记录每个栅格的偏移、形状和数据类型，下游可用open_packed_rasters零拷贝读取
+    """
+    ALIGNMENT = 64
+    
+    def __init__(self, pack_path, root=None):
+        self.pack_path = pack_path
+        self.index_path = pack_path + '.json'
+        self.root = root
+        self.items = {}
+        self._end = 0
+        self._lock = threading.Lock()
+        # 已预留区间但尚未写完的栅格数，close()等待其归零
+        self._writing = 0
+        self._written = threading.Condition(self._lock)
+        self._closed = False
+        
+        # 创建（或清空）打包文件
+        open(pack_path, 'wb').close()
+    
+    def append(self, key, array):
+        """追加一个栅格，返回其在打包文件中的偏移"""
+        array = np.ascontiguousarray(array)
+        
+        # 在锁内只预留写入区间，实际写入可并行进行
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("打包文件已关闭")
+            offset = (self._end + self.ALIGNMENT - 1) // self.ALIGNMENT * self.ALIGNMENT
+            self._end = offset + array.nbytes
+            self.items[key] = {
+                'offset': offset,
+                'shape': list(array.shape),
+                'dtype': array.dtype.str,
+            }
+            self._writing += 1
+        
+        try:
+            with open(self.pack_path, 'r+b') as f:
+                f.seek(offset)
+                f.write(array.data)
+        except Exception:
+            # 写入失败的栅格不写入索引
+            with self._lock:
+                self.items.pop(key, None)
+            raise
+        finally:
+            with self._written:
+                self._writing -= 1
+                self._written.notify_all()
+        return offset
+    
+    def key_for(self, input_path):
+        """输入路径对应的索引键（相对于root，使用/分隔）"""
+        key = os.path.relpath(input_path, self.root) if self.root else input_path
+        return key.replace(os.sep, '/')
+    
+    def alias(self, key, source_key):
+        """让key指向与source_key相同的栅格数据（用于内容重复的输入）"""
+        with self._lock:
+            self.items[key] = self.items[source_key]
+    
+    def close(self):
+        """等待正在写入的栅格完成，然后补齐文件长度并写出索引文件"""
+        with self._written:
+            self._closed = True
+            while self._writing:
+                self._written.wait()
+            with open(self.pack_path, 'r+b') as f:
+                f.truncate(self._end)
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                json.dump({'alignment': self.ALIGNMENT, 'items': self.items}, f, ensure_ascii=False)
+
+# 打包文件路径 -> PackedRasterWriter
+packed_writers = {}
+packed_writers_lock = threading.Lock()
+
+def open_packed_writer(pack_path, root=None):
+    """创建并登记打包写入器，供convert_single_file按输出路径查找"""
+    with packed_writers_lock:
+        writer = PackedRasterWriter(pack_path, root)
+        packed_writers[pack_path] = writer
+    return writer
+
+def close_packed_writers():
+    """关闭所有打包写入器并写出索引"""
+    with packed_writers_lock:
+        for writer in packed_writers.values():
+            writer.close()
+        packed_writers.clear()
+
+def open_packed_rasters(pack_path):
+    """
+    以内存映射方式打开打包文件
+    
+    返回:
+        {键: numpy数组}，数组均为内存映射视图，不复制像素数据
+    """
+    with open(pack_path + '.json', encoding='utf-8') as f:
+        index = json.load(f)
+    
+    if not index['items']:
+        return {}
+    
+    base = np.memmap(pack_path, dtype=np.uint8, mode='r')
+    rasters = {}
+    for key, item in index['items'].items():
+        dtype = np.dtype(item['dtype'])
+        count = int(np.prod(item['shape'])) * dtype.itemsize
+        rasters[key] = base[item['offset']:item['offset'] + count].view(dtype).reshape(item['shape'])
+    return rasters
+
+def build_save_args(target_format, quality=None, preset=None, tiff_compression=None):
+    """
+    根据目标格式、质量和编码预设生成Pillow保存参数
+    
+    参数:
+        target_format: 目标格式
+        quality: 图像质量 (1-100, 对jpg/jpeg、webp以及JPEG压缩的tiff有效)
+        preset: 编码预设 (fast/balanced/small)，None表示使用Pillow默认值
+        tiff_compression: TIFF压缩方式 (none/lzw/deflate/jpeg)，覆盖预设中的设置
+    
+    返回:
+        (Pillow格式名, 保存参数字典)
+    """
+    fmt = target_format.lower()
+    if fmt in ['jpg', 'jpeg', 'jpg/jpeg']:
+        pil_format = 'JPEG'
+        key = 'jpeg'
+    else:
+        pil_format = fmt.upper()
+        key = fmt
+    
+    save_args = {}
+    if preset is not None:
+        save_args.update(ENCODER_PRESETS[preset].get(key, {}))
+    
+    if key == 'tiff' and tiff_compression is not None:
+        save_args['compression'] = TIFF_COMPRESSIONS[tiff_compression]
+    
+    if quality is not None:
+        if key in ['jpeg', 'webp'] or (key == 'tiff' and save_args.get('compression') == 'jpeg'):
+            save_args['quality'] = quality
+    
+    return pil_format, save_args
+
+def convert_file(input_path, output_path, target_format, quality=None, resize=None, preset=None, tiff_compression=None, pyramid=None,
+                 region_header=None, region_workers=None):
+    """
+    转换单个JP2文件到指定格式，失败时抛出异常
     
     参数:
         input_path: 输入文件路径
@@ -24,43 +231,406 @@ def convert_single_file(input_path, output_path, target_format, quality=None, re
         target_format: 目标格式
         quality: 图像质量 (1-100, 仅对jpg/jpeg有效)
         resize: 调整大小 (width, height)
+        preset: 编码预设 (fast/balanced/small)
+        tiff_compression: TIFF压缩方式 (none/lzw/deflate/jpeg)
+        pyramid: 瓦片金字塔参数 (瓦片边长, 瓦片格式, 布局)，仅对pyramid格式有效
+        region_header: 文件头，提供时把图像拆分为多个区域并发解码
+        region_workers: 区域解码的并发线程数
     
     返回:
-        (成功标志, 输入路径, 输出路径, 错误信息)
+        {'stages': {阶段: 耗时秒数}, 'megapixels': 解码的百万像素数}
     """
-    try:
-        # 使用glymur读取JP2文件
+    # 瓦片金字塔：按级别和区域分块解码，不解码整幅图像
+    if target_format.lower() == PYRAMID_FORMAT:
+        tile_size, tile_format, layout = pyramid or DEFAULT_PYRAMID
+        pil_format, save_args = build_save_args(tile_format, quality, preset)
+        return build_pyramid(input_path, output_path, read_jp2_header(input_path), tile_size, tile_format, layout,
+                             pil_format, save_args, active_profiler())
+    
+    stages = {}
+    
+    # 使用glymur读取JP2文件
+    start = time.perf_counter()
+    if region_header is not None:
+        data = decode_regions(input_path, region_header, region_workers, active_profiler())
+    else:
         jp2 = glymur.Jp2k(input_path)
-        img = Image.fromarray(jp2[:])
-        
-        # 如果需要调整大小
+        data = jp2[:]
+    stages['decode'] = time.perf_counter() - start
+    megapixels = data.shape[0] * data.shape[1] / 1e6
+    
+    # 原始栅格输出：跳过图像编码，直接写出解码后的数组
+    if target_format.lower() in RAW_FORMATS:
         if resize and isinstance(resize, tuple) and len(resize) == 2:
-            img = img.resize(resize, Image.LANCZOS)
-        
-        # 保存参数
-        save_args = {}
-        if quality is not None and target_format.lower() in ['jpg', 'jpeg', 'jpg/jpeg']:
-            save_args['quality'] = quality
+            start = time.perf_counter()
+            data = np.asarray(Image.fromarray(data).resize(resize, Image.LANCZOS))
+            stages['transform'] = time.perf_counter() - start
         
-        # 保存为指定格式
-        if target_format.lower() in ['jpg', 'jpeg', 'jpg/jpeg']:
-            img.save(output_path, format='JPEG', **save_args)
+        start = time.perf_counter()
+        if target_format.lower() == 'npy':
+            np.save(output_path, data)
         else:
-            img.save(output_path, format=target_format.upper(), **save_args)
-        
+            writer = packed_writers[output_path]
+            writer.append(writer.key_for(input_path), data)
+        stages['encode'] = time.perf_counter() - start
+        return {'stages': stages, 'megapixels': megapixels}
+    
+    img = Image.fromarray(data)
+    
+    # 如果需要调整大小
+    if resize and isinstance(resize, tuple) and len(resize) == 2:
+        start = time.perf_counter()
+        img = img.resize(resize, Image.LANCZOS)
+        stages['transform'] = time.perf_counter() - start
+    
+    # 保存为指定格式
+    start = time.perf_counter()
+    pil_format, save_args = build_save_args(target_format, quality, preset, tiff_compression)
+    img.save(output_path, format=pil_format, **save_args)
+    stages['encode'] = time.perf_counter() - start
+    return {'stages': stages, 'megapixels': megapixels}
+
+def convert_single_file(input_path, output_path, target_format, quality=None, resize=None, preset=None, tiff_compression=None, pyramid=None,
+                        region_header=None, region_workers=None):
+    """
+    转换单个JP2文件到指定格式
+    
+    参数:
+        input_path: 输入文件路径
+        output_path: 输出文件路径
+        target_format: 目标格式
+        quality: 图像质量 (1-100, 仅对jpg/jpeg有效)
+        resize: 调整大小 (width, height)
+        preset: 编码预设 (fast/balanced/small)
+        tiff_compression: TIFF压缩方式 (none/lzw/deflate/jpeg)
+        pyramid: 瓦片金字塔参数 (瓦片边长, 瓦片格式, 布局)，仅对pyramid格式有效
+        region_header: 文件头，提供时把图像拆分为多个区域并发解码
+        region_workers: 区域解码的并发线程数
+    
+    返回:
+        (成功标志, 输入路径, 输出路径, 错误信息)
+    """
+    try:
+        convert_file(input_path, output_path, target_format, quality, resize, preset, tiff_compression, pyramid,
+                     region_header, region_workers)
         return (True, input_path, output_path, None)
     except Exception as e:
         return (False, input_path, output_path, str(e))
 
-def worker(args):
+def read_jp2_header(input_path):
+    """
+    只读取JP2文件头（不解码像素数据）
+    
+    参数:
+        input_path: 输入文件路径
+    
+    返回:
+        包含宽、高、通道数、位深、分块大小、分辨率级数等信息的字典
+    """
+    jp2 = glymur.Jp2k(input_path)
+    siz = jp2.codestream.segment[1]
+    cod = next((seg for seg in jp2.codestream.segment if seg.marker_id == 'COD'), None)
+    
+    width = siz.xsiz - siz.xosiz
+    height = siz.ysiz - siz.yosiz
+    return {
+        'width': width,
+        'height': height,
+        'components': siz.Csiz,
+        'bitdepth': max(siz.bitdepth),
+        'tile_width': siz.xtsiz,
+        'tile_height': siz.ytsiz,
+        'levels': cod.num_res if cod is not None else 0,
+        'file_size': os.path.getsize(input_path),
+        'megapixels': width * height / 1e6,
+    }
+
+def scan_jp2_headers(input_paths, max_workers=None, on_progress=None):
+    """
+    并行预扫描JP2文件头，建立内存索引
+    
+    参数:
+        input_paths: 输入文件路径列表
+        max_workers: 最大工作线程数（读取文件头以I/O为主，默认可高于CPU核心数）
+        on_progress: 每读取一个文件头后以(已完成数, 总数)调用
+    
+    返回:
+        {输入路径: 文件头字典}，读取失败的文件值为None
+    """
+    def safe_read(path):
+        try:
+            return read_jp2_header(path)
+        except Exception:
+            return None
+    
+    if max_workers is None:
+        max_workers = min(64, (os.cpu_count() or 1) * 4)
+    
+    headers = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for header in executor.map(safe_read, input_paths):
+            headers.append(header)
+            if on_progress is not None:
+                on_progress(len(headers), len(input_paths))
+    
+    return dict(zip(input_paths, headers))
+
+def get_task_weights(header_index, input_paths):
+    """
+    根据文件头索引计算每个文件的进度权重（百万像素）
+    
+    未能读取文件头的文件按已知文件的平均像素数估算
+    
+    返回:
+        {输入路径: 百万像素}
+    """
+    known = [header_index[p]['megapixels'] for p in input_paths if header_index.get(p)]
+    fallback = sum(known) / len(known) if known else 1.0
+    return {p: header_index[p]['megapixels'] if header_index.get(p) else fallback for p in input_paths}
+
+def find_jp2_files(input_dir, recursive=True):
+    """
+    查找目录中的所有.jp2文件
+    
+    返回:
+        输入文件路径列表
+    """
+    walk, walk_stats = walk_directory(input_dir, recursive=recursive)
+    return [os.path.join(root, f) for root, dirs, files in walk for f in files]
+
+def benchmark_presets(input_paths, target_format, quality=None, resize=None, tiff_compression=None):
+    """
+    对比各编码预设的编码耗时和输出大小
+    
+    每个文件只解码一次，然后用每个预设编码到内存中，不写出文件。
+    无法解码或编码的文件跳过，不计入任何预设的结果
+    
+    返回:
+        ({预设名: (总编码耗时秒数, 总输出字节数)}, 实际测试的文件数, [(跳过的文件路径, 错误信息)])
+    """
+    results = {preset: [0.0, 0] for preset in ENCODER_PRESETS}
+    measured = 0
+    skipped = []
+    for input_path in input_paths:
+        file_results = {}
+        try:
+            img = Image.fromarray(glymur.Jp2k(input_path)[:])
+            if resize:
+                img = img.resize(resize, Image.LANCZOS)
+            
+            for preset in ENCODER_PRESETS:
+                pil_format, save_args = build_save_args(target_format, quality, preset, tiff_compression)
+                buffer = io.BytesIO()
+                start = time.perf_counter()
+                img.save(buffer, format=pil_format, **save_args)
+                file_results[preset] = (time.perf_counter() - start, buffer.tell())
+        except Exception as e:
+            skipped.append((input_path, str(e)))
+            continue
+        
+        for preset, (encode_time, output_size) in file_results.items():
+            results[preset][0] += encode_time
+            results[preset][1] += output_size
+        measured += 1
+    
+    return {preset: tuple(value) for preset, value in results.items()}, measured, skipped
+
+# 去重时读取文件的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Linux FICLONE ioctl，用于在btrfs/xfs等文件系统上创建reflink
+FICLONE = 0x40049409
+
+def hash_file(path):
+    """计算文件内容的BLAKE2b摘要"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def find_duplicate_tasks(conversion_tasks, max_workers=None):
+    """
+    按输入文件内容查找重复的转换任务
+    
+    先按文件大小预筛选，只对大小相同的文件在线程池中计算哈希。
+    内容相同且转换参数相同的任务只保留第一个。
+    
+    参数:
+        conversion_tasks: 转换任务列表
+        max_workers: 计算哈希的最大线程数
+    
+    返回:
+        (需要实际转换的任务列表, [(源任务, 重复任务)])
+    """
+    by_size = {}
+    for task in conversion_tasks:
+        try:
+            size = os.path.getsize(task[0])
+        except OSError:
+            size = None
+        by_size.setdefault(size, []).append(task)
+    
+    # 只有大小相同的文件才可能内容相同
+    candidates = [task[0] for size, tasks in by_size.items() if size is not None and len(tasks) > 1 for task in tasks]
+    
+    def safe_hash(path):
+        try:
+            return hash_file(path)
+        except OSError:
+            return None
+    
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) + 4)
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = dict(zip(candidates, executor.map(safe_hash, candidates)))
+    
+    unique_tasks = []
+    duplicates = []
+    seen = {}
+    for task in conversion_tasks:
+        digest = digests.get(task[0])
+        if digest is None:
+            unique_tasks.append(task)
+            continue
+        
+        # 键包含除输入输出路径外的所有转换参数
+        key = (digest,) + tuple(task[2:])
+        if key in seen:
+            duplicates.append((seen[key], task))
+        else:
+            seen[key] = task
+            unique_tasks.append(task)
+    
+    return unique_tasks, duplicates
+
+def reflink_file(src, dst):
+    """通过FICLONE创建写时复制的副本，不支持时抛出OSError"""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("当前平台不支持reflink")
+    
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+def link_or_copy(src, dst, mode='link'):
+    """
+    用硬链接、reflink或复制把src填充到dst
+    
+    参数:
+        mode: link(硬链接→reflink→复制) / reflink(reflink→复制) / copy(直接复制)
+    
+    返回:
+        实际使用的方式
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    
+    if mode == 'link':
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError:
+            pass
+    
+    if mode in ['link', 'reflink']:
+        try:
+            reflink_file(src, dst)
+            return 'reflink'
+        except OSError:
+            pass
+    
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+def fill_duplicate_outputs(duplicates, results, mode='link'):
+    """
+    用源任务的输出填充重复任务的输出路径
+    
+    参数:
+        duplicates: find_duplicate_tasks返回的[(源任务, 重复任务)]
+        results: {源输入路径: (成功标志, 错误信息)}
+        mode: 填充方式，见link_or_copy
+    
+    返回:
+        [(成功标志, 输入路径, 输出路径, 错误信息)]
+    """
+    filled = []
+    for source, task in duplicates:
+        success, error = results.get(source[0], (False, "源文件未转换"))
+        if success:
+            try:
+                writer = packed_writers.get(task[1])
+                if writer is not None:
+                    writer.alias(writer.key_for(task[0]), writer.key_for(source[0]))
+                else:
+                    link_or_copy(source[1], task[1], mode)
+            except Exception as e:
+                success, error = False, str(e)
+        filled.append((success, task[0], task[1], error))
+    return filled
+
+def make_deadline_fn(timeout, seconds_per_megapixel, header_index=None):
+    """
+    生成按像素数缩放的超时计算函数
+    
+    超时秒数 = timeout + 百万像素数 * seconds_per_megapixel，
+    像素数优先取自预扫描索引，否则临时读取文件头，读取失败时只使用基础超时
+    """
+    def deadline(input_path):
+        header = header_index.get(input_path) if header_index else None
+        if header is None:
+            try:
+                header = read_jp2_header(input_path)
+            except Exception:
+                return timeout
+        return timeout + header['megapixels'] * seconds_per_megapixel
+    return deadline
+
+def worker(args, runner=None, prefetcher=None, governor=None, memory_estimate=0, metrics=None, splitter=None):
     """
     工作线程函数
     """
-    result = convert_single_file(*args)
+    if metrics is not None:
+        metrics.task_started()
+    # 剩余工作由少数大文件主导时，把当前文件拆分为区域并发解码
+    call_args = args
+    if splitter is not None and splitter.should_split(args[0]):
+        # 直接使用预扫描索引中的文件头，不再重新读取
+        call_args = args + (splitter.header_index[args[0]], splitter.workers)
+    if governor is not None:
+        governor.acquire(memory_estimate)
+    if prefetcher is not None:
+        prefetcher.acquire(args[0])
+    try:
+        if runner is not None:
+            result = runner.run(call_args)
+        else:
+            result = convert_single_file(*call_args)
+    finally:
+        if splitter is not None:
+            splitter.finish(args[0])
+        if prefetcher is not None:
+            prefetcher.release(args[0])
+        if governor is not None:
+            governor.release(memory_estimate)
+        if metrics is not None:
+            metrics.task_finished()
     result_queue.put(result)
     return result
 
-def convert_jp2_files(input_dir, output_dir, target_format, quality=None, resize=None, max_workers=None, recursive=True):
+def convert_jp2_files(input_dir, output_dir, target_format, quality=None, resize=None, max_workers=None, recursive=True, prescan=False,
+                      preset=None, tiff_compression=None, dedup=None, profile=None, profile_every=1,
+                      timeout=None, timeout_per_mp=2.0, retries=2, listing_cache=None, prefetch_mb=0, pipeline=None,
+                      max_rss_mb=None, report=None, metrics_port=None, metrics_file=None, metrics_interval=15.0, pyramid=None,
+                      region_split=None, region_min_mp=DEFAULT_MIN_MEGAPIXELS):
     """
     递归转换目录中的.jp2文件到指定格式
     
@@ -72,49 +642,203 @@ def convert_jp2_files(input_dir, output_dir, target_format, quality=None, resize
         resize: 调整大小 (width, height)
         max_workers: 最大工作线程数
         recursive: 是否递归处理子目录
+        prescan: 是否预扫描文件头，按像素数加权显示进度和剩余时间
+        preset: 编码预设 (fast/balanced/small)
+        tiff_compression: TIFF压缩方式 (none/lzw/deflate/jpeg)
+        dedup: 内容去重后重复输出的填充方式 (link/reflink/copy)，None表示不去重
+        profile: 性能分析输出文件前缀，None表示不分析
+        profile_every: 每N个文件分析一次
+        timeout: 单个文件的基础超时秒数，设置后每个文件在可终止的子进程中转换
+        timeout_per_mp: 每百万像素增加的超时秒数
+        retries: 临时性I/O错误的最大重试次数
+        listing_cache: 目录列表缓存文件路径，重复运行时只重新列出有变化的目录
+        prefetch_mb: 预读预算（MB），提前读取后续输入文件以隐藏存储I/O等待，0表示不预读
+        pipeline: (解码进程数, 变换进程数, 编码进程数)，设置后按阶段流水线执行
+        max_rss_mb: 内存上限（MB），按估算内存节流，避免被系统OOM终止
+        report: JSON运行报告输出路径
+        metrics_port: 在127.0.0.1的此端口上提供Prometheus文本格式的/metrics端点
+        metrics_file: 定期重写的指标文件路径（供node_exporter的textfile collector读取）
+        metrics_interval: 指标文件的重写间隔秒数
+        pyramid: 瓦片金字塔参数 (瓦片边长, 瓦片格式, 布局)，仅对pyramid格式有效，None表示使用默认值
+        region_split: 大文件区域并发解码模式 (auto/always)，None表示不拆分
+        region_min_mp: 只拆分不小于此百万像素数的文件
+    
+    返回:
+        文件头索引（未预扫描时为None），可供后续调度复用
     """
+    # 记录运行开始时的资源使用情况
+    run_start = time.time()
+    usage_start = read_resource_usage()
+    
     # 收集所有需要转换的文件
     conversion_tasks = []
     total_files = 0
     
-    # 遍历目录
-    walk_fn = os.walk if recursive else lambda d: [(d, [d for d in os.listdir(d) if os.path.isdir(os.path.join(d, d))], [f for f in os.listdir(d) if os.path.isfile(os.path.join(d, f))])]
+    # 打包模式下所有栅格写入同一个文件
+    packed = target_format.lower() == 'packed'
+    pack_path = os.path.join(output_dir, PACKED_FILENAME)
+    
+    # 金字塔模式下每个输入输出一个清单文件和对应的瓦片目录
+    if target_format.lower() == PYRAMID_FORMAT:
+        pyramid = pyramid or DEFAULT_PYRAMID
+        if resize:
+            print("金字塔格式按原始分辨率生成各级瓦片，忽略调整大小设置")
+            resize = None
+    else:
+        pyramid = None
+    
+    # 并发遍历目录
+    walk, walk_stats = walk_directory(input_dir, recursive=recursive, cache_path=listing_cache)
+    if listing_cache:
+        print(f"目录扫描: 重新列出 {walk_stats['listed']} 个目录, 复用缓存 {walk_stats['cached']} 个目录")
     
-    for root, dirs, files in walk_fn(input_dir):
+    for root, dirs, files in walk:
         # 创建对应的输出目录结构
         relative_path = os.path.relpath(root, input_dir)
         output_subdir = os.path.join(output_dir, relative_path)
-        os.makedirs(output_subdir, exist_ok=True)
+        if not packed:
+            os.makedirs(output_subdir, exist_ok=True)
 
         for file in files:
             if file.lower().endswith('.jp2'):
                 input_path = os.path.join(root, file)
                 output_filename = os.path.splitext(file)[0] + '.' + target_format.lower()
-                output_path = os.path.join(output_subdir, output_filename)
+                if packed:
+                    output_path = pack_path
+                elif pyramid is not None:
+                    output_path = pyramid_output_path(output_subdir, os.path.splitext(file)[0], pyramid[2])
+                else:
+                    output_path = os.path.join(output_subdir, output_filename)
                 
                 # 添加到任务列表
-                conversion_tasks.append((input_path, output_path, target_format, quality, resize))
+                conversion_tasks.append((input_path, output_path, target_format, quality, resize, preset, tiff_compression, pyramid))
                 total_files += 1
     
     if total_files == 0:
         print("未找到任何JP2文件进行转换")
-        return
+        return None
     
     # 确定工作线程数
     if max_workers is None:
         max_workers = min(32, os.cpu_count() + 4)  # 默认工作线程数
     
-    # 创建进度条
-    progress_bar = tqdm(total=total_files, desc="转换进度", unit="文件")
+    if packed:
+        open_packed_writer(pack_path, input_dir)
+    
+    # 运行期间导出实时指标
+    metrics = None
+    metrics_server = None
+    metrics_exporter = None
+    if metrics_port is not None or metrics_file:
+        metrics = ConversionMetrics()
+        if metrics_port is not None:
+            metrics_server = start_metrics_server(metrics.registry, metrics_port)
+            print(f"指标端点: http://127.0.0.1:{metrics_port}/metrics")
+        if metrics_file:
+            metrics_exporter = TextfileExporter(metrics.registry, metrics_file, metrics_interval)
+    
+    # 金字塔输出为目录树，无法用链接填充
+    if dedup and pyramid is not None:
+        print("金字塔格式不支持去重，忽略去重设置")
+        dedup = None
+    
+    # 内容去重：相同内容、相同参数的文件只转换一次
+    duplicates = []
+    if dedup:
+        conversion_tasks, duplicates = find_duplicate_tasks(conversion_tasks)
+        if duplicates:
+            print(f"发现 {len(duplicates)} 个内容重复的文件，将只转换一次")
+    task_count = len(conversion_tasks)
+    if metrics is not None:
+        metrics.set_planned(task_count)
+        if metrics_exporter is not None:
+            metrics_exporter.start()
+    
+    # 流水线模式的各阶段在独立进程中运行，打包写入器只存在于主进程中
+    if pipeline is not None and packed:
+        print("打包格式不支持流水线模式，改用线程池执行")
+        pipeline = None
+    if pipeline is not None and pyramid is not None:
+        # 金字塔的瓦片已经在共享线程池中按区域并行生成
+        print("金字塔格式不支持流水线模式，改用线程池执行")
+        pipeline = None
+    if region_split and (pipeline is not None or pyramid is not None):
+        # 流水线有独立的解码进程池，金字塔本身已按瓦片区域解码
+        print("流水线模式和金字塔格式下忽略区域拆分设置")
+        region_split = None
+    if pipeline is not None and (timeout is not None or profile or prefetch_mb > 0):
+        print("流水线模式下忽略超时、性能分析和预读设置")
+        timeout, profile, prefetch_mb = None, None, 0
+    
+    # 预扫描文件头，按百万像素加权进度（流水线模式需要文件头确定共享内存缓冲区大小，
+    # 内存限制和运行报告需要文件头估算单文件内存，区域拆分需要文件头判断剩余工作量）
+    header_index = None
+    weights = None
+    if prescan or pipeline is not None or max_rss_mb or report or region_split:
+        input_paths = [task[0] for task in conversion_tasks]
+        header_index = scan_jp2_headers(input_paths)
+        weights = get_task_weights(header_index, input_paths)
+        total_megapixels = sum(weights.values())
+        print(f"预扫描完成，共 {total_megapixels:.1f} 百万像素")
+        progress_bar = tqdm(total=total_megapixels, desc="转换进度", unit="MP",
+                            bar_format="{l_bar}{bar}| {n:.1f}/{total:.1f} MP [{elapsed}<{remaining}, {rate_fmt}{postfix}]")
+    else:
+        progress_bar = tqdm(total=task_count, desc="转换进度", unit="文件")
     
     # 成功和失败计数
     success_count = 0
     failure_count = 0
     
+    # 每个输入的转换结果，用于填充重复文件
+    task_results = {}
+    
+    # 估算每个文件的峰值内存分配（金字塔按瓦片分块解码，内存不随图像大小增长，只按当前RSS节流）
+    memory_estimates = {}
+    if header_index is not None and pyramid is None:
+        raw = target_format.lower() in RAW_FORMATS
+        for path, header in header_index.items():
+            if header is not None:
+                memory_estimates[path] = estimate_file_memory(header, resize, raw)
+    
+    # 按内存上限节流（流水线模式由共享内存缓冲区总量限制）
+    governor = None
+    if max_rss_mb and pipeline is None:
+        governor = MemoryGovernor(max_rss_mb * 1024 * 1024)
+    
+    # 剩余工作由少数大文件主导时拆分为区域并发解码，区域线程数不超过工作线程数
+    splitter = None
+    if region_split:
+        splitter = RegionSplitPolicy(header_index, region_split, region_min_mp, workers=min(os.cpu_count() or 1, max_workers))
+    
+    # 按工作线程进行性能分析
+    profiler = WorkerProfiler(profile_every) if profile else None
+    
+    # 打包写入器只存在于主进程中，无法在子进程中写入
+    if timeout is not None and packed:
+        print("打包格式不支持进程隔离，忽略超时设置")
+        timeout = None
+    
+    # 重试临时性错误、隔离永久性错误；设置超时时在可终止的子进程中转换
+    deadline_fn = make_deadline_fn(timeout, timeout_per_mp, header_index) if timeout is not None else None
+    runner = TaskRunner(convert_file, timeout=timeout, deadline_fn=deadline_fn, retries=retries, profiler=profiler,
+                        on_success=metrics.observe_info if metrics is not None else None)
+    
+    # 按任务提交顺序预读输入文件
+    prefetcher = None
+    if prefetch_mb > 0:
+        prefetcher = Prefetcher([task[0] for task in conversion_tasks], prefetch_mb * 1024 * 1024)
+        prefetcher.start()
+    
     # 使用线程池执行转换任务
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         # 提交所有任务
-        futures = [executor.submit(worker, task) for task in conversion_tasks]
+        if pipeline is not None:
+            # 流水线在各阶段进程中执行，这里只占用一个线程收集结果
+            memory_limit = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+            futures = [executor.submit(run_pipeline, conversion_tasks, header_index, pipeline, result_queue.put, memory_limit, metrics)]
+        else:
+            futures = [executor.submit(worker, task, runner, prefetcher, governor, memory_estimates.get(task[0], 0), metrics, splitter)
+                       for task in conversion_tasks]
         
         # 启动结果处理线程
         def process_results():
@@ -122,7 +846,11 @@ def convert_jp2_files(input_dir, output_dir, target_format, quality=None, resize
             while True:
                 try:
                     success, input_path, output_path, error = result_queue.get(timeout=0.1)
-                    progress_bar.update(1)
+                    if weights is not None:
+                        progress_bar.update(weights[input_path])
+                        progress_bar.set_postfix_str(f"{success_count + failure_count + 1}/{task_count} 文件")
+                    else:
+                        progress_bar.update(1)
                     
                     if success:
                         success_count += 1
@@ -130,11 +858,15 @@ def convert_jp2_files(input_dir, output_dir, target_format, quality=None, resize
                         failure_count += 1
                         with print_lock:
                             print(f"\n转换失败: {input_path} - {error}")
+                    task_results[input_path] = (success, error)
+                    if metrics is not None:
+                        # 打包文件是共享的，金字塔的输出字节数由convert_file返回的瓦片字节数记录
+                        metrics.observe_result(success, input_path, None if packed or pyramid is not None else output_path)
                     
                     result_queue.task_done()
                     
                     # 检查是否所有任务都已完成
-                    if progress_bar.n >= total_files:
+                    if success_count + failure_count >= task_count:
                         break
                 except queue.Empty:
                     # 检查是否所有任务都已完成
@@ -150,13 +882,120 @@ def convert_jp2_files(input_dir, output_dir, target_format, quality=None, resize
         concurrent.futures.wait(futures)
         result_thread.join()
     
+    # 流水线自身出错时，尚未返回结果的文件记为失败
+    pipeline_stats = None
+    if pipeline is not None:
+        try:
+            pipeline_stats = futures[0].result()
+        except Exception as e:
+            error = f"流水线执行失败: {e}"
+            print(f"\n{error}")
+            for task in conversion_tasks:
+                if task[0] not in task_results:
+                    failure_count += 1
+                    task_results[task[0]] = (False, error)
+                    if metrics is not None:
+                        metrics.observe_result(False, task[0], None)
+    
+    runner.shutdown()
+    if prefetcher is not None:
+        prefetcher.stop()
+    
     # 关闭进度条
     progress_bar.close()
     
+    # 用已转换的输出填充重复文件
+    if duplicates:
+        filled = fill_duplicate_outputs(duplicates, task_results, dedup)
+        saved_bytes = 0
+        for (source, task), (success, input_path, output_path, error) in zip(duplicates, filled):
+            if success:
+                success_count += 1
+                saved_bytes += os.path.getsize(input_path)
+            else:
+                failure_count += 1
+                print(f"重复文件填充失败: {input_path} - {error}")
+            task_results[input_path] = (success, error)
+            if metrics is not None:
+                metrics.observe_result(success, input_path, None)
+        print(f"去重: 跳过 {len(duplicates)} 个重复文件的转换，共 {saved_bytes / 1024 / 1024:.2f} MB")
+    
+    if profiler is not None:
+        written = profiler.write(profile)
+        if written:
+            print(f"性能分析 ({profiler.sampled_files} 个文件): {written[0]}, 折叠栈: {written[1]}")
+    
+    if metrics_exporter is not None:
+        metrics_exporter.stop()
+        print(f"指标文件: {metrics_file}")
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    
+    if packed:
+        close_packed_writers()
+        print(f"打包文件: {pack_path} (索引: {pack_path}.json)")
+    
     # 打印统计信息
     print(f"\n转换完成! 总文件数: {total_files}, 成功: {success_count}, 失败: {failure_count}")
+    if pipeline_stats is not None:
+        print(format_pipeline_stats(pipeline_stats))
+    if prefetcher is not None:
+        print(f"预读: {prefetcher.prefetched_files} 个文件 ({prefetcher.prefetched_bytes / 1024 / 1024:.1f} MB), "
+              f"隐藏I/O等待 {prefetcher.hidden_seconds:.2f}秒, 等待预读 {prefetcher.waited_seconds:.2f}秒")
+    if splitter is not None:
+        print(f"区域并发解码: {splitter.split_files} 个文件 ({splitter.split_megapixels:.1f} 百万像素)")
+    if runner.retried:
+        print(f"临时性错误重试: {runner.retried} 次")
+    if runner.quarantine:
+        quarantine_path = os.path.join(output_dir, 'quarantine.txt')
+        runner.write_quarantine(quarantine_path)
+        print(f"已隔离 {len(runner.quarantine)} 个无法处理的文件，列表见: {quarantine_path}")
+    
+    # 资源使用情况
+    usage = usage_delta(usage_start, read_resource_usage())
+    print(format_usage(usage))
+    if memory_estimates:
+        estimates = list(memory_estimates.values())
+        print(f"单文件内存估算: 最大 {format_bytes(max(estimates))}, 平均 {format_bytes(sum(estimates) / len(estimates))}")
+    if governor is not None:
+        print(f"内存限制 {max_rss_mb} MB: 节流 {governor.throttled} 次, 等待 {governor.waited_seconds:.2f}秒")
+    
+    if report:
+        all_tasks = conversion_tasks + [task for source, task in duplicates]
+        files = []
+        for task in all_tasks:
+            success, error = task_results.get(task[0], (False, "未完成"))
+            header = header_index.get(task[0]) if header_index else None
+            files.append({
+                'input': task[0],
+                'output': task[1],
+                'success': success,
+                'error': error,
+                'megapixels': header['megapixels'] if header else None,
+                'estimated_memory': memory_estimates.get(task[0]),
+            })
+        write_report(report, {
+            'input_dir': input_dir,
+            'output_dir': output_dir,
+            'format': target_format,
+            'summary': {
+                'total_files': total_files,
+                'success': success_count,
+                'failure': failure_count,
+                'duplicates': len(duplicates),
+                'elapsed_seconds': time.time() - run_start,
+            },
+            'resources': dict(usage, max_rss_limit=max_rss_mb * 1024 * 1024 if max_rss_mb else None,
+                              throttled=governor.throttled if governor else 0,
+                              throttle_wait_seconds=governor.waited_seconds if governor else 0.0),
+            'files': files,
+        })
+        print(f"运行报告: {report}")
+    
     if failure_count > 0:
         print("请检查上方错误信息以了解失败原因")
+    
+    return header_index
 
 def main():
     start_time = time.time()
@@ -164,24 +1003,95 @@ def main():
     parser = argparse.ArgumentParser(description='JP2文件格式转换工具')
     parser.add_argument('input_dir', help='输入目录路径')
     parser.add_argument('output_dir', help='输出目录路径')
-    parser.add_argument('format', choices=['png', 'jpg/jpeg', 'bmp', 'tiff'], 
-                       help='目标格式（png/jpg/jpeg/bmp/tiff）')
+    parser.add_argument('format', choices=['png', 'jpg/jpeg', 'bmp', 'tiff'] + RAW_FORMATS + [PYRAMID_FORMAT],
+                       help='目标格式（png/jpg/jpeg/bmp/tiff；npy为原始数组，packed为打包到单个可内存映射文件，pyramid为瓦片金字塔）')
     parser.add_argument('-q', '--quality', type=int, choices=range(1, 101), metavar="[1-100]",
                        help='图像质量 (1-100, 仅对jpg/jpeg有效)')
     parser.add_argument('-r', '--resize', nargs=2, type=int, metavar=("WIDTH", "HEIGHT"),
                        help='调整图像大小 (宽度 高度)')
+    parser.add_argument('--tile-size', type=int, choices=TILE_SIZES, default=DEFAULT_PYRAMID[0],
+                       help='金字塔瓦片边长 (默认256)')
+    parser.add_argument('--tile-format', choices=list(TILE_FORMATS), default=DEFAULT_PYRAMID[1],
+                       help='金字塔瓦片格式 (默认jpeg)')
+    parser.add_argument('--pyramid-layout', choices=LAYOUTS, default=DEFAULT_PYRAMID[2],
+                       help='金字塔布局: dzi(Deep Zoom)/xyz (默认dzi)')
     parser.add_argument('-w', '--workers', type=int, help='工作线程数 (默认为CPU核心数+4)')
     parser.add_argument('-nr', '--no-recursive', action='store_true', 
                        help='不递归处理子目录')
+    parser.add_argument('--listing-cache', metavar='PATH',
+                       help='目录列表缓存文件，重复运行时只重新列出修改时间有变化的目录')
+    parser.add_argument('--prefetch-mb', type=int, default=0, metavar='MB',
+                       help='预读预算(MB)，提前读取后续输入文件以重叠存储I/O与解码 (默认0，不预读)')
+    parser.add_argument('--pipeline', type=parse_pipeline_spec, metavar='D,T,E',
+                       help='按解码/变换/编码三个阶段流水线执行，分别指定各阶段进程数，例如 2,1,4')
+    parser.add_argument('--region-split', nargs='?', const='auto', choices=SPLIT_MODES,
+                       help='把大文件拆分为与分块对齐的区域并发解码: auto(剩余工作由少数大文件主导时自动拆分)/always (默认auto)')
+    parser.add_argument('--region-min-mp', type=float, default=DEFAULT_MIN_MEGAPIXELS, metavar='MP',
+                       help=f'只拆分不小于此百万像素数的文件 (默认{DEFAULT_MIN_MEGAPIXELS:g})')
+    parser.add_argument('--prescan', action='store_true',
+                       help='预扫描文件头，按像素数加权显示进度、速率和剩余时间')
+    parser.add_argument('-p', '--preset', choices=list(ENCODER_PRESETS),
+                       help='编码预设: fast(速度优先)/balanced(均衡)/small(体积优先)')
+    parser.add_argument('--tiff-compression', choices=list(TIFF_COMPRESSIONS),
+                       help='TIFF压缩方式，覆盖预设中的设置')
+    parser.add_argument('--dedup', nargs='?', const='link', choices=['link', 'reflink', 'copy'],
+                       help='按内容去重，相同文件只转换一次，其余输出用硬链接/reflink/复制填充 (默认link)')
+    parser.add_argument('--profile', metavar='PREFIX',
+                       help='对工作线程进行性能分析，输出<PREFIX>.pstats和<PREFIX>.collapsed.txt（火焰图）')
+    parser.add_argument('--profile-every', type=int, default=1, metavar='N',
+                       help='每N个文件分析一次以降低开销 (默认1，即全部分析)')
+    parser.add_argument('-t', '--timeout', type=float, metavar='SECONDS',
+                       help='单个文件的基础超时秒数，设置后在可终止的子进程中转换，超时文件会被隔离')
+    parser.add_argument('--timeout-per-mp', type=float, default=2.0, metavar='SECONDS',
+                       help='每百万像素增加的超时秒数 (默认2.0)')
+    parser.add_argument('--retries', type=int, default=2,
+                       help='临时性I/O错误的最大重试次数 (默认2)')
+    parser.add_argument('--max-rss', type=int, metavar='MB',
+                       help='内存上限(MB)，按估算的单文件内存节流，避免被系统OOM终止')
+    parser.add_argument('--report', metavar='PATH',
+                       help='输出JSON运行报告（每个文件的结果、内存估算和资源使用情况）')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                       help='在127.0.0.1的指定端口提供Prometheus格式的实时指标 (/metrics)')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                       help='定期重写的Prometheus指标文件，供node_exporter的textfile collector采集')
+    parser.add_argument('--metrics-interval', type=float, default=15.0, metavar='SECONDS',
+                       help='指标文件的重写间隔秒数 (默认15)')
+    parser.add_argument('--benchmark', type=int, metavar='N',
+                       help='仅取前N个文件对比各编码预设的编码耗时与输出大小，不执行转换')
     
     args = parser.parse_args()
     
-    # 创建输出目录
-    os.makedirs(args.output_dir, exist_ok=True)
-    
     # 处理调整大小参数
     resize = tuple(args.resize) if args.resize else None
     
+    # 编码预设基准测试
+    if args.benchmark:
+        if args.format in RAW_FORMATS + [PYRAMID_FORMAT]:
+            print("原始栅格和金字塔格式不支持编码预设测试")
+            return
+        
+        input_paths = find_jp2_files(args.input_dir, recursive=not args.no_recursive)[:args.benchmark]
+        if not input_paths:
+            print("未找到任何JP2文件进行测试")
+            return
+        
+        print(f"使用 {len(input_paths)} 个文件测试编码预设 (格式: {args.format})")
+        results, measured, skipped = benchmark_presets(input_paths, args.format, quality=args.quality, resize=resize,
+                                                       tiff_compression=args.tiff_compression)
+        for input_path, error in skipped:
+            print(f"跳过无法处理的文件: {input_path} - {error}")
+        if measured == 0:
+            print("没有可以测试的文件")
+            return
+        print(f"实际测试 {measured} 个文件")
+        print(f"{'预设':<10}{'编码耗时(秒)':>14}{'输出大小(MB)':>14}")
+        for preset, (encode_time, output_size) in results.items():
+            print(f"{preset:<10}{encode_time:>14.3f}{output_size / 1024 / 1024:>14.2f}")
+        return
+    
+    # 创建输出目录
+    os.makedirs(args.output_dir, exist_ok=True)
+    
     # 执行转换
     convert_jp2_files(
         args.input_dir, 
@@ -190,7 +1100,27 @@ def main():
         quality=args.quality,
         resize=resize,
         max_workers=args.workers,
-        recursive=not args.no_recursive
+        recursive=not args.no_recursive,
+        prescan=args.prescan,
+        preset=args.preset,
+        tiff_compression=args.tiff_compression,
+        dedup=args.dedup,
+        profile=args.profile,
+        profile_every=args.profile_every,
+        timeout=args.timeout,
+        timeout_per_mp=args.timeout_per_mp,
+        retries=args.retries,
+        listing_cache=args.listing_cache,
+        prefetch_mb=args.prefetch_mb,
+        pipeline=args.pipeline,
+        max_rss_mb=args.max_rss,
+        report=args.report,
+        metrics_port=args.metrics_port,
+        metrics_file=args.metrics_file,
+        metrics_interval=args.metrics_interval,
+        pyramid=(args.tile_size, args.tile_format, args.pyramid_layout),
+        region_split=args.region_split,
+        region_min_mp=args.region_min_mp
     )
     
     # 计算并显示总耗时
@@ -198,4 +1128,6 @@ def main():
     print(f"总耗时: {elapsed_time:.2f}秒")
 
 if __name__ == "__main__":
+    # 打包为可执行文件后，spawn启动的子进程（进程隔离和流水线模式）会重新执行入口，需要先交给multiprocessing处理
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -9,7 +9,14 @@ from PIL import Image
 import concurrent.futures
 
 # 导入原始转换器模块的功能
-from jp2_converter import convert_single_file
+from jp2_converter import (convert_single_file, scan_jp2_headers, get_task_weights, ENCODER_PRESETS,
+                           RAW_FORMATS, PACKED_FILENAME, open_packed_writer, close_packed_writers)
+
+# 导入目录遍历模块
+from jp2_walker import walk_directory
+
+# 导入性能分析模块
+from jp2_profiler import WorkerProfiler
 
 # 导入主题模块
 from theme import apply_modern_theme, customize_text_widget, center_window
@@ -45,6 +52,10 @@ class JP2ConverterGUI(tk.Tk):
         max_recommended = min(64, cpu_count * 2) if cpu_count else 32
         self.max_workers = tk.IntVar(value=max_recommended)
         self.recursive = tk.BooleanVar(value=True)
+        self.prescan = tk.BooleanVar(value=False)
+        self.preset = tk.StringVar(value="默认")
+        self.profile = tk.BooleanVar(value=False)
+        self.profile_every = tk.IntVar(value=1)
         
         # 转换状态变量
         self.is_converting = False
@@ -55,6 +66,16 @@ class JP2ConverterGUI(tk.Tk):
         self.failure_count = 0
         self.current_task_index = 0
         
+        # 每次开始或取消转换时递增，后台提交线程据此判断自己所属的那次转换是否仍然有效
+        self.run_generation = 0
+        self.run_lock = threading.Lock()
+        
+        # 预扫描得到的文件头索引和按百万像素计的进度权重
+        self.header_index = None
+        self.task_weights = None
+        self.total_megapixels = 0.0
+        self.completed_megapixels = 0.0
+        
         # 创建队列用于存储转换结果
         self.result_queue = queue.Queue()
         
@@ -62,6 +83,7 @@ class JP2ConverterGUI(tk.Tk):
         self.executor = None
         self.futures = []
         self.result_thread = None
+        self.profiler = None
         
         # 创建UI组件
         self.create_widgets()
@@ -128,6 +150,14 @@ class JP2ConverterGUI(tk.Tk):
         self.elapsed_time_label = ttk.Label(status_frame, text="0秒")
         self.elapsed_time_label.grid(row=3, column=1, sticky=tk.W)
         
+        ttk.Label(status_frame, text="剩余时间:").grid(row=3, column=2, sticky=tk.W, padx=5)
+        self.eta_label = ttk.Label(status_frame, text="-")
+        self.eta_label.grid(row=3, column=3, sticky=tk.W)
+        
+        ttk.Label(status_frame, text="速率:").grid(row=4, column=0, sticky=tk.W, padx=5)
+        self.rate_label = ttk.Label(status_frame, text="-")
+        self.rate_label.grid(row=4, column=1, sticky=tk.W)
+        
         # 创建日志区域
         log_frame = ttk.LabelFrame(main_frame, text="日志", padding="10")
         log_frame.pack(fill=tk.BOTH, expand=True, pady=10)
@@ -200,7 +230,7 @@ class JP2ConverterGUI(tk.Tk):
         
         ttk.Label(format_frame, text="目标格式:").pack(side=tk.LEFT)
         
-        formats = ["jpg/jpeg", "png", "bmp", "tiff"]
+        formats = ["jpg/jpeg", "png", "bmp", "tiff"] + RAW_FORMATS
         format_combobox = ttk.Combobox(format_frame, textvariable=self.target_format, values=formats, state="readonly", width=10)
         format_combobox.pack(side=tk.LEFT, padx=5)
         
@@ -217,6 +247,16 @@ class JP2ConverterGUI(tk.Tk):
         quality_spinbox = ttk.Spinbox(quality_frame, from_=1, to=100, textvariable=self.quality, width=5)
         quality_spinbox.pack(side=tk.LEFT, padx=5)
         
+        # 编码预设设置
+        preset_frame = ttk.Frame(parent, padding="5")
+        preset_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(preset_frame, text="编码预设:").pack(side=tk.LEFT)
+        presets = ["默认"] + list(ENCODER_PRESETS)
+        preset_combobox = ttk.Combobox(preset_frame, textvariable=self.preset, values=presets, state="readonly", width=10)
+        preset_combobox.pack(side=tk.LEFT, padx=5)
+        ttk.Label(preset_frame, text="(fast: 速度优先, balanced: 均衡, small: 体积优先)").pack(side=tk.LEFT, padx=5)
+        
         # 调整大小设置
         resize_frame = ttk.Frame(parent, padding="5")
         resize_frame.pack(fill=tk.X, pady=5)
@@ -244,6 +284,24 @@ class JP2ConverterGUI(tk.Tk):
         
         # 添加说明标签
         ttk.Label(workers_frame, text=f"(推荐值: {max_recommended}, 暂停时可修改)").pack(side=tk.LEFT, padx=5)
+        
+        # 预扫描设置
+        prescan_frame = ttk.Frame(parent, padding="5")
+        prescan_frame.pack(fill=tk.X, pady=5)
+        
+        prescan_check = ttk.Checkbutton(prescan_frame, text="预扫描文件头（按像素数计算进度和剩余时间）", variable=self.prescan)
+        prescan_check.pack(side=tk.LEFT)
+        
+        # 性能分析设置
+        profile_frame = ttk.Frame(parent, padding="5")
+        profile_frame.pack(fill=tk.X, pady=5)
+        
+        profile_check = ttk.Checkbutton(profile_frame, text="性能分析（结果写入输出目录）", variable=self.profile)
+        profile_check.pack(side=tk.LEFT)
+        ttk.Label(profile_frame, text="每").pack(side=tk.LEFT, padx=(10, 0))
+        profile_every_spinbox = ttk.Spinbox(profile_frame, from_=1, to=1000, textvariable=self.profile_every, width=5)
+        profile_every_spinbox.pack(side=tk.LEFT, padx=5)
+        ttk.Label(profile_frame, text="个文件分析一次").pack(side=tk.LEFT)
     
     def browse_input_dir(self):
         directory = filedialog.askdirectory(title="选择输入目录")
@@ -280,14 +338,30 @@ class JP2ConverterGUI(tk.Tk):
     
     def update_status(self):
         completed = self.success_count + self.failure_count
-        self.progress_var.set((completed / self.total_files) * 100 if self.total_files > 0 else 0)
+        elapsed = time.time() - self.start_time
+        
+        if self.task_weights is not None and self.total_megapixels > 0:
+            # 按百万像素加权计算进度、速率和剩余时间
+            fraction = self.completed_megapixels / self.total_megapixels
+            rate = self.completed_megapixels / elapsed if elapsed > 0 else 0
+            self.rate_label.config(text=f"{rate:.2f} MP/秒")
+            if rate > 0:
+                remaining = (self.total_megapixels - self.completed_megapixels) / rate
+                self.eta_label.config(text=f"{remaining:.0f}秒")
+        else:
+            fraction = completed / self.total_files if self.total_files > 0 else 0
+            rate = completed / elapsed if elapsed > 0 else 0
+            self.rate_label.config(text=f"{rate:.2f} 文件/秒")
+            if rate > 0:
+                remaining = (self.total_files - completed) / rate
+                self.eta_label.config(text=f"{remaining:.0f}秒")
+        self.progress_var.set(fraction * 100)
         
         self.total_files_label.config(text=str(self.total_files))
         self.completed_files_label.config(text=str(completed))
         self.success_files_label.config(text=str(self.success_count))
         self.failed_files_label.config(text=str(self.failure_count))
         
-        elapsed = time.time() - self.start_time
         self.elapsed_time_label.config(text=f"{elapsed:.2f}秒")
         
         # 更新状态标签
@@ -304,6 +378,7 @@ class JP2ConverterGUI(tk.Tk):
         target_format = self.target_format.get()
         quality = self.quality.get()
         recursive = self.recursive.get()
+        preset = self.preset.get() if self.preset.get() in ENCODER_PRESETS else None
         if not input_dir or not os.path.isdir(input_dir):
             messagebox.showerror("错误", "请选择有效的输入目录")
             return None, 0
@@ -319,14 +394,19 @@ class JP2ConverterGUI(tk.Tk):
         conversion_tasks = []
         total_files = 0
         
-        # 遍历目录
-        walk_fn = os.walk if recursive else lambda d: [(d, [d for d in os.listdir(d) if os.path.isdir(os.path.join(d, d))], [f for f in os.listdir(d) if os.path.isfile(os.path.join(d, f))])]        
+        # 打包模式下所有栅格写入同一个文件
+        packed = target_format == "packed"
+        pack_path = os.path.join(output_dir, PACKED_FILENAME)
+        
+        # 并发遍历目录
         self.log(f"开始扫描目录: {input_dir}")
-        for root, dirs, files in walk_fn(input_dir):
+        walk, walk_stats = walk_directory(input_dir, recursive=recursive)
+        for root, dirs, files in walk:
             # 创建对应的输出目录结构
             relative_path = os.path.relpath(root, input_dir)
             output_subdir = os.path.join(output_dir, relative_path)
-            os.makedirs(output_subdir, exist_ok=True)
+            if not packed:
+                os.makedirs(output_subdir, exist_ok=True)
 
             for file in files:
                 if file.lower().endswith('.jp2'):
@@ -334,14 +414,14 @@ class JP2ConverterGUI(tk.Tk):
                     # 处理jpg/jpeg格式选项
                     actual_format = "jpg" if target_format == "jpg/jpeg" else target_format
                     output_filename = os.path.splitext(file)[0] + '.' + actual_format.lower()
-                    output_path = os.path.join(output_subdir, output_filename)
+                    output_path = pack_path if packed else os.path.join(output_subdir, output_filename)
                     
                     # 添加到任务列表
                     resize = None
                     if self.resize_width.get() > 0 and self.resize_height.get() > 0:
                         resize = (self.resize_width.get(), self.resize_height.get())
                     
-                    conversion_tasks.append((input_path, output_path, actual_format, quality, resize))
+                    conversion_tasks.append((input_path, output_path, actual_format, quality, resize, preset))
                     total_files += 1
         
         self.log(f"扫描完成，找到 {total_files} 个JP2文件")
@@ -373,6 +453,9 @@ class JP2ConverterGUI(tk.Tk):
                     self.failure_count += 1
                     self.log(f"转换失败: {os.path.basename(input_path)} - {error}")
                 
+                if self.task_weights is not None:
+                    self.completed_megapixels += self.task_weights.get(input_path, 0.0)
+                
                 self.result_queue.task_done()
                 
                 # 更新UI
@@ -412,6 +495,12 @@ class JP2ConverterGUI(tk.Tk):
             messagebox.showinfo("提示", "未找到任何JP2文件进行转换")
             return
         
+        self.header_index = None
+        self.task_weights = None
+        self.total_megapixels = 0.0
+        self.completed_megapixels = 0.0
+        self.futures = []
+        
         # 重置计数器
         self.success_count = 0
         self.failure_count = 0
@@ -426,22 +515,72 @@ class JP2ConverterGUI(tk.Tk):
         self.cancel_button.config(state=tk.NORMAL)
         self.workers_spinbox.config(state=tk.DISABLED)
         
-        # 创建线程池
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers.get())
+        # 打包模式需要先创建打包写入器
+        if self.target_format.get() == "packed":
+            open_packed_writer(os.path.join(self.output_dir.get(), PACKED_FILENAME), self.input_dir.get())
         
-        # 提交所有任务
-        self.log(f"开始转换，使用 {self.max_workers.get()} 个工作线程")
-        self.futures = [self.executor.submit(self.worker, task) for task in self.conversion_tasks]
+        # 按工作线程进行性能分析
+        self.profiler = WorkerProfiler(self.profile_every.get()) if self.profile.get() else None
         
-        # 启动结果处理线程
-        self.result_thread = threading.Thread(target=self.process_results)
-        self.result_thread.daemon = True
-        self.result_thread.start()
+        # 预扫描和提交任务在后台线程中进行，大目录或网络存储上预扫描耗时较长，避免界面卡死
+        with self.run_lock:
+            self.run_generation += 1
+            generation = self.run_generation
+        max_workers = self.max_workers.get()
+        prescan = self.prescan.get()
+        tasks = list(self.conversion_tasks)
+        threading.Thread(target=self.submit_tasks, args=(generation, tasks, max_workers, prescan), daemon=True).start()
         
         # 定时更新UI
         self.update_status()
         self.after(100, self.update_ui)
     
+    def submit_tasks(self, generation, tasks, max_workers, prescan):
+        # 只使用启动时捕获的任务列表；预扫描期间取消后又重新开始时，
+        # 共享状态已属于新的一次转换，本线程不能再写入或提交任务
+        header_index = None
+        task_weights = None
+        total_megapixels = 0.0
+        
+        # 预扫描文件头，建立索引供进度计算复用
+        if prescan:
+            input_paths = [task[0] for task in tasks]
+            step = max(1, len(input_paths) // 10)
+            
+            def on_progress(done, total):
+                # 已取消的预扫描不再输出进度，以免与新的一次转换的日志混在一起
+                if done % step == 0 and done < total and generation == self.run_generation:
+                    self.log(f"预扫描文件头: {done}/{total}")
+            
+            self.log("正在预扫描文件头...")
+            header_index = scan_jp2_headers(input_paths, on_progress=on_progress)
+            task_weights = get_task_weights(header_index, input_paths)
+            total_megapixels = sum(task_weights.values())
+        
+        with self.run_lock:
+            # 预扫描期间已取消，或已开始了新的一次转换
+            if generation != self.run_generation or not self.is_converting:
+                return
+            
+            if prescan:
+                self.total_megapixels = total_megapixels
+                self.header_index = header_index
+                self.task_weights = task_weights
+            
+            # 创建线程池并提交所有任务
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+            self.futures = [self.executor.submit(self.worker, task) for task in tasks]
+        
+        # 日志写入界面控件，不在持有锁时进行，避免与界面线程中的取消操作互相等待
+        if prescan:
+            self.log(f"预扫描完成，共 {total_megapixels:.1f} 百万像素")
+        self.log(f"开始转换，使用 {max_workers} 个工作线程")
+        
+        # 启动结果处理线程
+        self.result_thread = threading.Thread(target=self.process_results)
+        self.result_thread.daemon = True
+        self.result_thread.start()
+    
     def worker(self, args):
         # 检查是否暂停
         while self.is_paused and self.is_converting:
@@ -452,7 +591,10 @@ class JP2ConverterGUI(tk.Tk):
             return None
         
         # 执行转换
-        result = convert_single_file(*args)
+        if self.profiler is not None:
+            result = self.profiler.profile_call(convert_single_file, *args)
+        else:
+            result = convert_single_file(*args)
         self.result_queue.put(result)
         return result
     
@@ -508,13 +650,19 @@ class JP2ConverterGUI(tk.Tk):
             return
         
         if messagebox.askyesno("确认", "确定要取消当前转换任务吗？"):
-            self.is_converting = False
-            self.is_paused = False
+            with self.run_lock:
+                self.run_generation += 1
+                self.is_converting = False
+                self.is_paused = False
+                executor = self.executor
+                self.executor = None
             
             # 关闭线程池
-            if self.executor is not None:
-                self.executor.shutdown(wait=False)
-                self.executor = None
+            if executor is not None:
+                executor.shutdown(wait=False)
+            
+            # 写出已完成部分的打包索引（会等待正在写入的栅格完成）
+            close_packed_writers()
             
             # 重置UI状态
             self.start_button.config(text="开始转换", state=tk.NORMAL)
@@ -534,6 +682,16 @@ class JP2ConverterGUI(tk.Tk):
             self.executor.shutdown(wait=True)
             self.executor = None
         
+        # 写出打包索引
+        close_packed_writers()
+        
+        # 写出性能分析结果
+        if self.profiler is not None:
+            written = self.profiler.write(os.path.join(self.output_dir.get(), "jp2_profile"))
+            if written:
+                self.log(f"性能分析结果: {written[0]}, 折叠栈: {written[1]}")
+            self.profiler = None
+        
         # 重置UI状态
         self.start_button.config(text="开始转换", state=tk.NORMAL)
         self.pause_button.config(text="暂停", state=tk.DISABLED)
@@ -564,7 +722,9 @@ class JP2ConverterGUI(tk.Tk):
                 return
             
             # 取消转换
-            self.is_converting = False
+            with self.run_lock:
+                self.run_generation += 1
+                self.is_converting = False
             if self.executor is not None:
                 self.executor.shutdown(wait=False)
         
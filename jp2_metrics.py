@@ -0,0 +1,194 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 指标名前缀
+PREFIX = 'jp2conv'
+
+# 阶段耗时直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+class MetricsRegistry:
+    """
+    线程安全的指标集合，可渲染为Prometheus文本格式
+    
+    支持计数器(counter)、仪表(gauge)和直方图(histogram)，标签以关键字参数传入
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._values = {}
+        self._histograms = {}
+    
+    def _declare(self, name, kind, help_text):
+        if name not in self._meta:
+            self._meta[name] = (kind, help_text)
+    
+    def inc(self, name, value=1.0, help_text='', **labels):
+        """计数器增加value"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'counter', help_text)
+            self._values[key] = self._values.get(key, 0.0) + value
+    
+    def set(self, name, value, help_text='', **labels):
+        """设置仪表的当前值"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'gauge', help_text)
+            self._values[key] = value
+    
+    def add(self, name, value, help_text='', **labels):
+        """仪表增加value（可为负）"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'gauge', help_text)
+            self._values[key] = self._values.get(key, 0.0) + value
+    
+    def observe(self, name, value, help_text='', buckets=LATENCY_BUCKETS, **labels):
+        """向直方图记录一次观测值"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'histogram', help_text)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+    
+    def render(self):
+        """渲染为Prometheus文本格式"""
+        with self._lock:
+            lines = []
+            for name, (kind, help_text) in sorted(self._meta.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == 'histogram':
+                    for (key_name, labels), histogram in sorted(self._histograms.items()):
+                        if key_name != name:
+                            continue
+                        for bound, count in zip(histogram['buckets'], histogram['counts']):
+                            lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+                else:
+                    for (key_name, labels), value in sorted(self._values.items()):
+                        if key_name == name:
+                            lines.append(f"{name}{_format_labels(labels)} {value}")
+            return '\n'.join(lines) + '\n'
+
+class ConversionMetrics:
+    """转换任务的指标：完成/失败文件数、输入输出字节数、百万像素、各阶段耗时、队列深度和活动工作线程数"""
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+    
+    def set_planned(self, count):
+        self.registry.set(f'{PREFIX}_files_planned', count, '本次运行计划转换的文件数')
+        self.registry.set(f'{PREFIX}_queue_depth', count, '等待处理的任务数', queue='pending')
+    
+    def task_started(self):
+        self.registry.add(f'{PREFIX}_queue_depth', -1, '等待处理的任务数', queue='pending')
+        self.registry.add(f'{PREFIX}_active_workers', 1, '正在处理文件的工作线程数')
+    
+    def task_finished(self):
+        self.registry.add(f'{PREFIX}_active_workers', -1, '正在处理文件的工作线程数')
+    
+    def set_queue_depth(self, queue_name, depth):
+        self.registry.set(f'{PREFIX}_queue_depth', depth, '等待处理的任务数', queue=queue_name)
+    
+    def set_active_workers(self, count):
+        self.registry.set(f'{PREFIX}_active_workers', count, '正在处理文件的工作线程数')
+    
+    def observe_result(self, success, input_path, output_path):
+        """记录一个文件的转换结果"""
+        status = 'success' if success else 'failure'
+        self.registry.inc(f'{PREFIX}_files_total', 1, '已处理的文件数', status=status)
+        try:
+            self.registry.inc(f'{PREFIX}_input_bytes_total', os.path.getsize(input_path), '已处理的输入字节数')
+            if success and output_path and os.path.isfile(output_path):
+                self.registry.inc(f'{PREFIX}_output_bytes_total', os.path.getsize(output_path), '已写出的输出字节数')
+        except OSError:
+            pass
+    
+    def observe_info(self, info):
+        """记录convert_file返回的各阶段耗时和像素数，以及输出为多个文件时（金字塔）的输出字节数"""
+        if not info:
+            return
+        for stage, seconds in info.get('stages', {}).items():
+            self.registry.observe(f'{PREFIX}_stage_seconds', seconds, '各阶段单文件耗时（秒）', stage=stage)
+        if info.get('megapixels'):
+            self.registry.inc(f'{PREFIX}_megapixels_total', info['megapixels'], '已解码的百万像素数')
+        if info.get('output_bytes'):
+            self.registry.inc(f'{PREFIX}_output_bytes_total', info['output_bytes'], '已写出的输出字节数')
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+    
+    def do_GET(self):
+        if self.path not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # 不在控制台输出抓取日志，避免干扰进度条
+        pass
+
+def start_metrics_server(registry, port, host='127.0.0.1'):
+    """
+    在后台线程中启动Prometheus文本格式的HTTP端点（/metrics）
+    
+    返回:
+        HTTP服务器对象，调用shutdown()停止
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+class TextfileExporter:
+    """定期把指标重写到文件，供node_exporter的textfile collector读取"""
+    def __init__(self, registry, path, interval=15.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def write(self):
+        # 先写临时文件再替换，避免采集到写了一半的文件
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.registry.render())
+        os.replace(temp_path, self.path)
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+    
+    def start(self):
+        self.write()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止定期写入，并写出最终值"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
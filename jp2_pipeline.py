@@ -0,0 +1,336 @@
+import time
+import argparse
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+# 阶段名称
+DECODE = 'decode'
+TRANSFORM = 'transform'
+ENCODE = 'encode'
+STAGE_NAMES = {DECODE: '解码', TRANSFORM: '变换', ENCODE: '编码'}
+
+# 每个消费者进程对应的队列长度
+QUEUE_DEPTH_PER_WORKER = 2
+
+def parse_pipeline_spec(spec):
+    """
+    解析"解码,变换,编码"形式的阶段进程数，例如"2,1,4"
+    
+    返回:
+        (解码进程数, 变换进程数, 编码进程数)
+    """
+    message = "流水线进程数格式应为 解码,变换,编码，且每项为不小于1的整数，例如 2,1,4"
+    try:
+        counts = tuple(int(part) for part in spec.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(message)
+    if len(counts) != 3 or min(counts) < 1:
+        raise argparse.ArgumentTypeError(message)
+    return counts
+
+def estimate_raster_bytes(header, resize=None):
+    """根据文件头估算解码后（以及调整大小后）栅格的最大字节数"""
+    itemsize = 1 if header['bitdepth'] <= 8 else 2
+    components = header['components']
+    size = header['width'] * header['height'] * components * itemsize
+    if resize:
+        size = max(size, resize[0] * resize[1] * components * itemsize)
+    return size
+
+def _attach_slots(slot_names):
+    return [shared_memory.SharedMemory(name=name) for name in slot_names]
+
+def _close_slots(slots):
+    for shm in slots:
+        shm.close()
+
+def _slot_array(slots, slot, shape, dtype):
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=slots[slot].buf)
+
+def _decode_worker(slot_names, task_queue, free_slots, transform_queue, encode_queue, result_queue, stats_queue):
+    """解码进程：读取JP2并把栅格写入空闲的共享内存缓冲区"""
+    import glymur
+    
+    slots = _attach_slots(slot_names)
+    slot_size = slots[0].size if slots else 0
+    busy = 0.0
+    count = 0
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        
+        # 先取得空闲缓冲区（没有空闲缓冲区时在此等待，下游阶段因此形成背压）
+        slot = free_slots.get()
+        start = time.perf_counter()
+        try:
+            data = glymur.Jp2k(task[0])[:]
+            info = {'stages': {}, 'megapixels': data.shape[0] * data.shape[1] / 1e6}
+            if data.nbytes <= slot_size:
+                _slot_array(slots, slot, data.shape, data.dtype)[...] = data
+                item = (task, slot, data.shape, data.dtype.str, None, info)
+            else:
+                # 文件头缺失时无法预估大小，放不下的栅格直接通过队列传递
+                free_slots.put(slot)
+                item = (task, None, data.shape, data.dtype.str, data, info)
+            del data
+        except Exception as e:
+            free_slots.put(slot)
+            result_queue.put((False, task[0], task[1], str(e)))
+            item = None
+        elapsed = time.perf_counter() - start
+        busy += elapsed
+        count += 1
+        
+        if item is not None:
+            item[5]['stages'][DECODE] = elapsed
+            resize = task[4]
+            if resize and isinstance(resize, tuple) and len(resize) == 2:
+                transform_queue.put(item)
+            else:
+                encode_queue.put(item)
+    
+    _close_slots(slots)
+    stats_queue.put((DECODE, busy, count))
+
+def _transform_worker(slot_names, transform_queue, free_slots, encode_queue, result_queue, stats_queue):
+    """变换进程：调整大小，结果原地写回同一个缓冲区（缓冲区按两者中较大的尺寸分配）"""
+    from PIL import Image
+    
+    slots = _attach_slots(slot_names)
+    busy = 0.0
+    count = 0
+    while True:
+        item = transform_queue.get()
+        if item is None:
+            break
+        
+        task, slot, shape, dtype, data, info = item
+        start = time.perf_counter()
+        try:
+            source = data if slot is None else _slot_array(slots, slot, shape, dtype)
+            resized = np.asarray(Image.fromarray(source).resize(task[4], Image.LANCZOS))
+            del source
+            if slot is None:
+                item = (task, None, resized.shape, resized.dtype.str, resized, info)
+            else:
+                _slot_array(slots, slot, resized.shape, resized.dtype)[...] = resized
+                item = (task, slot, resized.shape, resized.dtype.str, None, info)
+            del resized
+        except Exception as e:
+            if slot is not None:
+                free_slots.put(slot)
+            result_queue.put((False, task[0], task[1], str(e)))
+            item = None
+        elapsed = time.perf_counter() - start
+        busy += elapsed
+        count += 1
+        
+        if item is not None:
+            info['stages'][TRANSFORM] = elapsed
+            encode_queue.put(item)
+    
+    _close_slots(slots)
+    stats_queue.put((TRANSFORM, busy, count))
+
+def _encode_worker(slot_names, encode_queue, free_slots, result_queue, stats_queue):
+    """编码进程：把缓冲区中的栅格编码写出，然后归还缓冲区"""
+    from PIL import Image
+    from jp2_converter import build_save_args
+    
+    slots = _attach_slots(slot_names)
+    busy = 0.0
+    count = 0
+    while True:
+        item = encode_queue.get()
+        if item is None:
+            break
+        
+        task, slot, shape, dtype, data, info = item
+        input_path, output_path, target_format = task[0], task[1], task[2]
+        start = time.perf_counter()
+        try:
+            raster = data if slot is None else _slot_array(slots, slot, shape, dtype)
+            if target_format.lower() == 'npy':
+                np.save(output_path, raster)
+            else:
+                img = Image.fromarray(raster)
+                pil_format, save_args = build_save_args(target_format, task[3], *task[5:7])
+                img.save(output_path, format=pil_format, **save_args)
+                del img
+            del raster
+            result = (True, input_path, output_path, None)
+        except Exception as e:
+            result = (False, input_path, output_path, str(e))
+        finally:
+            if slot is not None:
+                free_slots.put(slot)
+        elapsed = time.perf_counter() - start
+        busy += elapsed
+        count += 1
+        if result[0]:
+            # 成功时附带各阶段耗时，由主进程拆出
+            info['stages'][ENCODE] = elapsed
+            result += (info,)
+        result_queue.put(result)
+    
+    _close_slots(slots)
+    stats_queue.put((ENCODE, busy, count))
+
+def _sample_queue_depths(metrics, queues):
+    for name, stage_queue in queues.items():
+        try:
+            metrics.set_queue_depth(name, stage_queue.qsize())
+        except NotImplementedError:
+            # macOS不支持Queue.qsize()
+            return
+
+def run_pipeline(conversion_tasks, header_index, workers=(1, 1, 1), on_result=None, memory_limit=None, metrics=None):
+    """
+    以解码、变换、编码三个独立的进程池流水线方式执行转换任务
+    
+    栅格通过主进程预先分配的固定数量共享内存缓冲区在阶段之间传递，不经过pickle；
+    阶段之间的队列有长度上限，缓冲区数量同时限制了内存占用。
+    变换阶段原地写回，只有解码阶段需要申请缓冲区，因此不会因缓冲区不足而死锁
+    
+    参数:
+        conversion_tasks: 转换任务列表
+        header_index: 文件头索引，用于确定缓冲区大小
+        workers: (解码进程数, 变换进程数, 编码进程数)
+        on_result: 每个文件完成时以(成功标志, 输入路径, 输出路径, 错误信息)调用
+        memory_limit: 共享内存缓冲区的总字节数上限，None表示按进程数和队列长度分配
+        metrics: ConversionMetrics实例，记录各阶段耗时和队列深度
+    
+    返回:
+        {阶段: {'workers': 进程数, 'busy': 忙碌秒数, 'count': 处理数, 'utilization': 利用率}}，
+        以及'slots'、'slot_size'、'elapsed'、'crashed'（异常退出进程的退出码列表）和'unfinished'（因此未完成的文件数）
+    """
+    decode_workers, transform_workers, encode_workers = workers
+    needs_transform = any(task[4] for task in conversion_tasks)
+    if not needs_transform:
+        transform_workers = 0
+    
+    # 缓冲区大小取所有文件中最大的栅格
+    sizes = [estimate_raster_bytes(header_index[task[0]], task[4]) for task in conversion_tasks if header_index.get(task[0])]
+    slot_size = max(sizes) if sizes else 0
+    
+    transform_depth = QUEUE_DEPTH_PER_WORKER * transform_workers
+    encode_depth = QUEUE_DEPTH_PER_WORKER * encode_workers
+    slot_count = decode_workers + transform_workers + encode_workers + transform_depth + encode_depth
+    if memory_limit is not None and slot_size > 0:
+        slot_count = max(1, min(slot_count, memory_limit // slot_size))
+    
+    context = multiprocessing.get_context('spawn')
+    slots = [shared_memory.SharedMemory(create=True, size=slot_size) for _ in range(slot_count)] if slot_size > 0 else []
+    slot_names = [shm.name for shm in slots]
+    
+    task_queue = context.Queue()
+    free_slots = context.Queue()
+    transform_queue = context.Queue(maxsize=max(1, transform_depth))
+    encode_queue = context.Queue(maxsize=encode_depth)
+    result_queue = context.Queue()
+    stats_queue = context.Queue()
+    
+    # 没有共享内存缓冲区时（文件头全部缺失）所有栅格都通过队列传递
+    for slot in range(slot_count if slots else decode_workers):
+        free_slots.put(slot)
+    
+    processes = []
+    for _ in range(decode_workers):
+        processes.append(context.Process(target=_decode_worker, args=(slot_names, task_queue, free_slots, transform_queue, encode_queue, result_queue, stats_queue), daemon=True))
+    for _ in range(transform_workers):
+        processes.append(context.Process(target=_transform_worker, args=(slot_names, transform_queue, free_slots, encode_queue, result_queue, stats_queue), daemon=True))
+    for _ in range(encode_workers):
+        processes.append(context.Process(target=_encode_worker, args=(slot_names, encode_queue, free_slots, result_queue, stats_queue), daemon=True))
+    
+    start = time.perf_counter()
+    try:
+        for process in processes:
+            process.start()
+        
+        for task in conversion_tasks:
+            task_queue.put(task)
+        
+        if metrics is not None:
+            metrics.set_active_workers(len(processes))
+        
+        # 收集结果直到所有任务完成，按输入路径记录尚未返回结果的任务
+        outstanding = {task[0]: task for task in conversion_tasks}
+        exit_codes = []
+        while outstanding:
+            if metrics is not None:
+                _sample_queue_depths(metrics, {'pending': task_queue, TRANSFORM: transform_queue, ENCODE: encode_queue})
+            try:
+                result = result_queue.get(timeout=1)
+            except queue.Empty:
+                exit_codes = [process.exitcode for process in processes if not process.is_alive()]
+                if exit_codes:
+                    break
+                continue
+            if outstanding.pop(result[1], None) is None:
+                continue
+            if metrics is not None and len(result) > 4:
+                metrics.observe_info(result[4])
+            if on_result is not None:
+                on_result(result[:4])
+        elapsed = time.perf_counter() - start
+        
+        stage_stats = {stage: {'workers': 0, 'busy': 0.0, 'count': 0} for stage in STAGE_NAMES}
+        if exit_codes:
+            # 工作进程异常退出（解码库崩溃或被OOM终止）时无法确定它持有的任务和缓冲区，
+            # 剩余任务全部报告为失败，其余进程在finally中终止
+            error = f"流水线工作进程异常退出（退出码: {', '.join(str(code) for code in exit_codes)}），文件未完成转换"
+            for task in outstanding.values():
+                if on_result is not None:
+                    on_result((False, task[0], task[1], error))
+        else:
+            # 依次通知各阶段退出
+            for stage_queue, count in [(task_queue, decode_workers), (transform_queue, transform_workers), (encode_queue, encode_workers)]:
+                for _ in range(count):
+                    stage_queue.put(None)
+            
+            for _ in processes:
+                try:
+                    stage, busy, count = stats_queue.get(timeout=10)
+                except queue.Empty:
+                    break
+                stage_stats[stage]['workers'] += 1
+                stage_stats[stage]['busy'] += busy
+                stage_stats[stage]['count'] += count
+            
+            for process in processes:
+                process.join(5)
+        if metrics is not None:
+            metrics.set_active_workers(0)
+            _sample_queue_depths(metrics, {'pending': task_queue, TRANSFORM: transform_queue, ENCODE: encode_queue})
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for shm in slots:
+            shm.close()
+            shm.unlink()
+    
+    for stats in stage_stats.values():
+        capacity = elapsed * stats['workers']
+        stats['utilization'] = stats['busy'] / capacity if capacity > 0 else 0.0
+    stage_stats['slots'] = slot_count if slots else 0
+    stage_stats['slot_size'] = slot_size
+    stage_stats['elapsed'] = elapsed
+    stage_stats['crashed'] = exit_codes
+    stage_stats['unfinished'] = len(outstanding)
+    return stage_stats
+
+def format_pipeline_stats(stats):
+    """把run_pipeline返回的统计格式化为一行文字"""
+    parts = []
+    for stage, name in STAGE_NAMES.items():
+        stage_stats = stats[stage]
+        if stage_stats['workers']:
+            parts.append(f"{name} {stage_stats['utilization'] * 100:.0f}% ({stage_stats['workers']}进程, {stage_stats['count']}个)")
+    shared_mb = stats['slots'] * stats['slot_size'] / 1024 / 1024
+    if stats['crashed']:
+        return f"流水线工作进程异常退出，{stats['unfinished']} 个文件未完成转换; 共享内存 {stats['slots']} 个缓冲区共 {shared_mb:.1f} MB"
+    return f"流水线阶段利用率: {', '.join(parts)}; 共享内存 {stats['slots']} 个缓冲区共 {shared_mb:.1f} MB"
@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+
+# 预读时每次读取的块大小
+READ_CHUNK_SIZE = 1024 * 1024
+
+# 文件状态
+PENDING = 'pending'
+READING = 'reading'
+READY = 'ready'
+SKIPPED = 'skipped'
+DONE = 'done'
+
+class Prefetcher:
+    """
+    按任务提交顺序提前读取后续输入文件，使存储I/O与解码重叠
+    
+    glymur只能从文件路径解码，因此预读的目标是把文件内容读入操作系统页缓存：
+    先用posix_fadvise(WILLNEED)提示内核预读（支持时），再顺序读取整个文件，
+    解码线程随后打开文件时直接命中缓存。已预读但尚未解码的字节数不超过budget
+    """
+    def __init__(self, input_paths, budget, threads=4):
+        """
+        参数:
+            input_paths: 按处理顺序排列的输入文件路径
+            budget: 已预读但尚未被解码消费的最大字节数
+            threads: 预读线程数（网络存储上多个并发读取可以隐藏更多延迟）
+        """
+        self.input_paths = list(input_paths)
+        self.budget = budget
+        self.threads = threads
+        
+        self.prefetched_files = 0
+        self.prefetched_bytes = 0
+        self.hidden_seconds = 0.0
+        self.waited_seconds = 0.0
+        
+        self._cond = threading.Condition()
+        self._next = 0
+        self._ahead_bytes = 0
+        self._state = {}
+        self._sizes = {}
+        self._read_time = {}
+        self._stopped = False
+        self._workers = []
+    
+    def start(self):
+        for _ in range(self.threads):
+            thread = threading.Thread(target=self._run, daemon=True)
+            thread.start()
+            self._workers.append(thread)
+    
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._workers:
+            thread.join()
+        self._workers.clear()
+    
+    def _take_next(self):
+        """取下一个需要预读的文件，超出预算时等待解码线程消费"""
+        with self._cond:
+            while not self._stopped:
+                if self._next >= len(self.input_paths):
+                    return None
+                
+                path = self.input_paths[self._next]
+                if self._state.get(path) == SKIPPED:
+                    # 解码线程已经先处理到这个文件
+                    self._next += 1
+                    continue
+                
+                if path not in self._sizes:
+                    try:
+                        self._sizes[path] = os.path.getsize(path)
+                    except OSError:
+                        self._sizes[path] = 0
+                
+                size = self._sizes[path]
+                if self._ahead_bytes > 0 and self._ahead_bytes + size > self.budget:
+                    self._cond.wait()
+                    continue
+                
+                self._next += 1
+                self._state[path] = READING
+                self._ahead_bytes += size
+                return path
+            return None
+    
+    def _run(self):
+        buffer = bytearray(READ_CHUNK_SIZE)
+        while True:
+            path = self._take_next()
+            if path is None:
+                return
+            
+            start = time.perf_counter()
+            try:
+                with open(path, 'rb', buffering=0) as f:
+                    if hasattr(os, 'posix_fadvise'):
+                        try:
+                            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                        except OSError:
+                            pass
+                    while f.readinto(buffer):
+                        pass
+            except OSError:
+                pass
+            elapsed = time.perf_counter() - start
+            
+            with self._cond:
+                self._read_time[path] = elapsed
+                self._state[path] = READY
+                self.prefetched_files += 1
+                self.prefetched_bytes += self._sizes[path]
+                self._cond.notify_all()
+    
+    def acquire(self, input_path):
+        """
+        解码线程处理文件前调用：文件正在预读时等待其完成，尚未开始预读时跳过预读
+        """
+        start = time.perf_counter()
+        with self._cond:
+            state = self._state.get(input_path, PENDING)
+            if state == PENDING:
+                self._state[input_path] = SKIPPED
+                self._cond.notify_all()
+                return
+            
+            while self._state[input_path] == READING and not self._stopped:
+                self._cond.wait()
+            
+            waited = time.perf_counter() - start
+            self.waited_seconds += waited
+            self.hidden_seconds += max(0.0, self._read_time.get(input_path, 0.0) - waited)
+    
+    def release(self, input_path):
+        """解码线程处理完文件后调用，释放其占用的预读预算"""
+        with self._cond:
+            if self._state.get(input_path) == READY:
+                self._ahead_bytes -= self._sizes[input_path]
+                self._state[input_path] = DONE
+                self._cond.notify_all()
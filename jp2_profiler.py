@@ -0,0 +1,215 @@
+import os
+import sys
+import pstats
+import cProfile
+import itertools
+import threading
+
+# 折叠栈输出的最大调用深度
+MAX_STACK_DEPTH = 64
+
+# 当前线程正在采样的分析器（见active_profiler）
+_current = threading.local()
+
+def active_profiler():
+    """
+    返回正在分析当前线程所处理文件的WorkerProfiler，未在采样时返回None
+    
+    文件内部再提交到线程池的任务（区域解码、金字塔瓦片）应在提交前取得它，
+    并通过profile_task执行，使池线程中的耗时计入同一份统计
+    """
+    return getattr(_current, 'profiler', None)
+
+class _RawStats:
+    """包装来自工作子进程的原始统计字典，使其可被pstats.Stats加载"""
+    def __init__(self, stats):
+        self._stats = stats
+        self.stats = stats
+    
+    def create_stats(self):
+        # pstats.Stats加载后会清空stats，这里每次重新提供
+        self.stats = dict(self._stats)
+
+class WorkerProfiler:
+    """
+    按工作线程分别进行cProfile分析，结束后合并统计结果
+    
+    在子进程中执行的任务由调用方采集统计后通过add_stats加入
+    
+    Python 3.12起cProfile基于sys.monitoring，同一时刻只能有一个分析器生效且覆盖所有线程，
+    此时改为共享一个分析器，在有采样文件正在处理时启用
+    """
+    def __init__(self, every=1):
+        """
+        参数:
+            every: 每N个文件分析一次（1表示分析全部文件），用于降低生产环境开销
+        """
+        self.every = max(1, every)
+        self.sampled_files = 0
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = []
+        self._raw_stats = []
+        
+        # 3.12+ 共享分析器及其引用计数
+        self._shared = sys.version_info >= (3, 12)
+        self._shared_profile = None
+        self._active = 0
+    
+    def should_sample(self):
+        """按采样间隔判断下一个文件是否需要分析"""
+        return next(self._counter) % self.every == 0
+    
+    def _enable(self):
+        if self._shared:
+            with self._lock:
+                if self._shared_profile is None:
+                    self._shared_profile = cProfile.Profile()
+                    self._profiles.append(self._shared_profile)
+                self._active += 1
+                if self._active == 1:
+                    self._shared_profile.enable()
+            return
+        
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        profile.enable()
+    
+    def _disable(self):
+        if self._shared:
+            with self._lock:
+                self._active -= 1
+                if self._active == 0:
+                    self._shared_profile.disable()
+            return
+        
+        self._local.profile.disable()
+    
+    def profile_call(self, func, *args, **kwargs):
+        """调用func，按采样间隔决定是否对本次调用进行分析"""
+        if not self.should_sample():
+            return func(*args, **kwargs)
+        
+        with self._lock:
+            self.sampled_files += 1
+        previous = active_profiler()
+        _current.profiler = self
+        self._enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._disable()
+            _current.profiler = previous
+    
+    def profile_task(self, func, *args, **kwargs):
+        """在线程池线程中分析一个属于已采样文件的子任务，不计入采样文件数"""
+        self._enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._disable()
+    
+    def add_stats(self, stats):
+        """加入在工作子进程中采集的原始统计（cProfile.Profile.stats）"""
+        with self._lock:
+            self._raw_stats.append(_RawStats(stats))
+            self.sampled_files += 1
+    
+    def merged_stats(self):
+        """
+        合并所有工作线程的统计结果
+        
+        返回:
+            pstats.Stats，没有任何采样时返回None
+        """
+        with self._lock:
+            sources = list(self._profiles) + list(self._raw_stats)
+        
+        stats = None
+        for source in sources:
+            if isinstance(source, cProfile.Profile):
+                source.create_stats()
+                if not source.stats:
+                    continue
+            if stats is None:
+                stats = pstats.Stats(source)
+            else:
+                stats.add(source)
+        return stats
+    
+    def write(self, output_prefix):
+        """
+        写出合并后的统计结果
+        
+        参数:
+            output_prefix: 输出文件前缀，生成<前缀>.pstats和<前缀>.collapsed.txt
+        
+        返回:
+            (pstats文件路径, 折叠栈文件路径)，没有任何采样时返回None
+        """
+        stats = self.merged_stats()
+        if stats is None:
+            return None
+        
+        output_dir = os.path.dirname(output_prefix)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        pstats_path = output_prefix + '.pstats'
+        collapsed_path = output_prefix + '.collapsed.txt'
+        stats.dump_stats(pstats_path)
+        with open(collapsed_path, 'w', encoding='utf-8') as f:
+            for stack, value in sorted(stats_to_collapsed(stats).items()):
+                f.write(f"{stack} {value}\n")
+        return pstats_path, collapsed_path
+
+def _label(func):
+    """生成折叠栈中的函数名（不能包含分号和空格）"""
+    filename, lineno, name = func
+    label = f"{os.path.basename(filename)}:{lineno}({name})" if lineno else name
+    return label.replace(';', ',').replace(' ', '_')
+
+def stats_to_collapsed(stats):
+    """
+    把pstats的调用关系图转换为折叠栈格式（flamegraph.pl/speedscope可读）
+    
+    cProfile只记录调用者-被调用者的边，不记录完整调用栈，
+    这里按每条边的累计时间占比把函数自身耗时分摊到各条调用路径上
+    
+    返回:
+        {以;连接的调用栈: 自身耗时(微秒)}
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    
+    collapsed = {}
+    
+    def walk(func, share, stack, on_stack):
+        cc, nc, tt, ct, callers = entries[func]
+        stack = stack + [_label(func)]
+        self_time = int(tt * share * 1e6)
+        if self_time > 0:
+            key = ';'.join(stack)
+            collapsed[key] = collapsed.get(key, 0) + self_time
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+        
+        for callee, edge_time in callees.get(func, []):
+            callee_total = entries[callee][3]
+            # 跳过递归调用和可忽略的分支
+            if callee in on_stack or callee_total <= 0 or edge_time * share < 1e-6:
+                continue
+            walk(callee, min(1.0, edge_time * share / callee_total), stack, on_stack | {callee})
+    
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        if not callers:
+            walk(func, 1.0, [], {func})
+    
+    return collapsed
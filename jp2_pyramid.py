@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import threading
+import concurrent.futures
+import numpy as np
+from PIL import Image
+import glymur
+
+# 瓦片边长
+TILE_SIZES = [256, 512]
+
+# 瓦片格式（命令行名称 -> 文件扩展名）
+TILE_FORMATS = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}
+
+# 金字塔布局：dzi为Deep Zoom（<名称>.dzi + <名称>_files/级别/列_行），xyz为<名称>/z/x/y
+LAYOUTS = ['dzi', 'xyz']
+
+# 默认金字塔参数 (瓦片边长, 瓦片格式, 布局)
+DEFAULT_PYRAMID = (256, 'jpeg', 'dzi')
+
+# XYZ布局的清单文件名
+XYZ_MANIFEST = 'tiles.json'
+
+# 所有文件共享的瓦片线程池（glymur和Pillow在解码、编码时释放GIL）
+_tile_executor = None
+_tile_executor_lock = threading.Lock()
+
+def _get_tile_executor():
+    global _tile_executor
+    with _tile_executor_lock:
+        if _tile_executor is None:
+            _tile_executor = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _tile_executor
+
+def pyramid_output_path(output_subdir, stem, layout):
+    """金字塔的清单文件路径（作为任务的输出路径）"""
+    if layout == 'dzi':
+        return os.path.join(output_subdir, stem + '.dzi')
+    return os.path.join(output_subdir, stem, XYZ_MANIFEST)
+
+def plan_levels(width, height, tile_size, layout):
+    """
+    规划金字塔各级别
+    
+    dzi从1x1像素的级别0开始，每级翻倍直到原始尺寸；
+    xyz从整幅图像放入一个瓦片的缩放级别0开始
+    
+    返回:
+        [(级别号, 相对原始分辨率的缩小指数, 级别宽, 级别高)]，按级别号升序
+    """
+    longest = max(width, height)
+    if layout == 'dzi':
+        max_level = (longest - 1).bit_length()
+    else:
+        max_level = ((longest + tile_size - 1) // tile_size - 1).bit_length()
+    
+    levels = []
+    for level in range(max_level + 1):
+        shift = max_level - level
+        levels.append((level, shift, (width + (1 << shift) - 1) >> shift, (height + (1 << shift) - 1) >> shift))
+    return levels
+
+def read_level_region(jp2, header, shift, x0, y0, x1, y1):
+    """
+    读取缩小2^shift倍的原生级别上[x0,x1)×[y0,y1)区域
+    
+    直接解码JPEG 2000对应的分辨率级别和区域，只解码覆盖该区域的码块；
+    shift不能超过码流的分辨率级数
+    """
+    scale = 1 << shift
+    return jp2[y0 * scale:min(y1 * scale, header['height']):scale, x0 * scale:min(x1 * scale, header['width']):scale]
+
+def _tile_path(output_path, layout, level, column, row, extension):
+    if layout == 'dzi':
+        return os.path.join(os.path.splitext(output_path)[0] + '_files', str(level), f"{column}_{row}.{extension}")
+    return os.path.join(os.path.dirname(output_path), str(level), str(column), f"{row}.{extension}")
+
+def _save_tile(data, output_path, layout, level, column, row, tile_size, extension, pil_format, save_args):
+    """编码写出一个瓦片，返回写出的字节数"""
+    if layout == 'xyz' and data.shape[:2] != (tile_size, tile_size):
+        # XYZ瓦片固定为正方形，边缘瓦片补零
+        padded = np.zeros((tile_size, tile_size) + data.shape[2:], dtype=data.dtype)
+        padded[:data.shape[0], :data.shape[1]] = data
+        data = padded
+    tile_path = _tile_path(output_path, layout, level, column, row, extension)
+    os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+    Image.fromarray(data).save(tile_path, format=pil_format, **save_args)
+    return os.path.getsize(tile_path)
+
+def _build_tile_row(input_path, output_path, header, level, shift, level_width, level_height, row,
+                    tile_size, layout, extension, pil_format, save_args):
+    """生成一个原生级别中的一行瓦片，每个瓦片单独读取其区域，内存按瓦片而不是按整幅图像占用"""
+    # 每个任务打开自己的Jp2k对象，glymur读取时会修改对象上的解码参数
+    jp2 = glymur.Jp2k(input_path)
+    decode_time = 0.0
+    encode_time = 0.0
+    output_bytes = 0
+    y0 = row * tile_size
+    y1 = min(y0 + tile_size, level_height)
+    columns = (level_width + tile_size - 1) // tile_size
+    for column in range(columns):
+        x0 = column * tile_size
+        x1 = min(x0 + tile_size, level_width)
+        
+        start = time.perf_counter()
+        data = read_level_region(jp2, header, shift, x0, y0, x1, y1)
+        decode_time += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        output_bytes += _save_tile(data, output_path, layout, level, column, row, tile_size, extension, pil_format, save_args)
+        encode_time += time.perf_counter() - start
+        del data
+    return decode_time, encode_time, columns, output_bytes
+
+def _build_derived_levels(input_path, output_path, header, derived_levels, tile_size, layout, extension, pil_format, save_args):
+    """
+    生成比码流最低原生分辨率还小的各级别
+    
+    只解码一次最低原生级别的整幅栅格，之后每级由上一级缩小得到，
+    这部分内存与最低原生级别的大小（原图的1/4^级数）相关，而不是按瓦片
+    """
+    start = time.perf_counter()
+    step = 1 << header['levels']
+    image = Image.fromarray(glymur.Jp2k(input_path)[::step, ::step])
+    decode_time = time.perf_counter() - start
+    encode_time = 0.0
+    tiles = 0
+    output_bytes = 0
+    
+    # 从大到小逐级缩小
+    for level, shift, level_width, level_height in sorted(derived_levels, key=lambda item: item[1]):
+        start = time.perf_counter()
+        image = image.resize((level_width, level_height), Image.LANCZOS)
+        data = np.asarray(image)
+        decode_time += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        for row in range((level_height + tile_size - 1) // tile_size):
+            for column in range((level_width + tile_size - 1) // tile_size):
+                tile = data[row * tile_size:(row + 1) * tile_size, column * tile_size:(column + 1) * tile_size]
+                output_bytes += _save_tile(tile, output_path, layout, level, column, row, tile_size, extension, pil_format, save_args)
+                tiles += 1
+        encode_time += time.perf_counter() - start
+    return decode_time, encode_time, tiles, output_bytes
+
+def write_manifest(output_path, header, tile_size, tile_format, layout, max_level):
+    """写出DZI或XYZ清单"""
+    extension = TILE_FORMATS[tile_format]
+    if layout == 'dzi':
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{extension}" Overlap="0" TileSize="{tile_size}">\n'
+                    f'  <Size Width="{header["width"]}" Height="{header["height"]}"/>\n'
+                    '</Image>\n')
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'width': header['width'],
+                'height': header['height'],
+                'tile_size': tile_size,
+                'format': extension,
+                'min_zoom': 0,
+                'max_zoom': max_level,
+                'tiles': '{z}/{x}/{y}.' + extension,
+            }, f, ensure_ascii=False, indent=2)
+
+def build_pyramid(input_path, output_path, header, tile_size, tile_format, layout, pil_format, save_args, profiler=None):
+    """
+    由JP2的原生分辨率级别生成瓦片金字塔
+    
+    码流原生分辨率级别上的每个瓦片直接按对应的分辨率级别和区域解码，内存按瓦片占用，
+    各行瓦片提交到共享的瓦片线程池并行生成；比最低原生分辨率还小的级别由一次解码的
+    最低原生级别逐级缩小得到。所有瓦片完成后才写出清单，清单存在即表示金字塔完整
+    
+    参数:
+        input_path: 输入文件路径
+        output_path: 清单文件路径（见pyramid_output_path）
+        header: read_jp2_header返回的文件头
+        tile_size: 瓦片边长
+        tile_format: 瓦片格式 (jpeg/png/webp)
+        layout: 布局 (dzi/xyz)
+        pil_format: Pillow格式名
+        save_args: Pillow保存参数
+        profiler: 正在分析本文件的WorkerProfiler，提供时各瓦片任务也在池线程中分析
+    
+    返回:
+        {'stages': {阶段: 耗时秒数}, 'megapixels': 百万像素数, 'tiles': 瓦片数, 'output_bytes': 瓦片和清单的总字节数}
+    """
+    extension = TILE_FORMATS[tile_format]
+    levels = plan_levels(header['width'], header['height'], tile_size, layout)
+    
+    native_levels = [item for item in levels if item[1] <= header['levels']]
+    derived_levels = [item for item in levels if item[1] > header['levels']]
+    
+    executor = _get_tile_executor()
+    
+    def submit(func, *args):
+        if profiler is not None:
+            return executor.submit(profiler.profile_task, func, *args)
+        return executor.submit(func, *args)
+    
+    futures = []
+    if derived_levels:
+        futures.append(submit(_build_derived_levels, input_path, output_path, header, derived_levels,
+                              tile_size, layout, extension, pil_format, save_args))
+    for level, shift, level_width, level_height in native_levels:
+        for row in range((level_height + tile_size - 1) // tile_size):
+            futures.append(submit(_build_tile_row, input_path, output_path, header, level, shift,
+                                  level_width, level_height, row, tile_size, layout, extension,
+                                  pil_format, save_args))
+    
+    decode_time = 0.0
+    encode_time = 0.0
+    tiles = 0
+    output_bytes = 0
+    try:
+        for future in futures:
+            part_decode, part_encode, part_tiles, part_bytes = future.result()
+            decode_time += part_decode
+            encode_time += part_encode
+            tiles += part_tiles
+            output_bytes += part_bytes
+    finally:
+        # 失败时取消尚未开始的行，避免继续占用线程池
+        for future in futures:
+            future.cancel()
+    
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    write_manifest(output_path, header, tile_size, tile_format, layout, levels[-1][0])
+    output_bytes += os.path.getsize(output_path)
+    return {'stages': {'decode': decode_time, 'encode': encode_time}, 'megapixels': header['megapixels'],
+            'tiles': tiles, 'output_bytes': output_bytes}
@@ -0,0 +1,140 @@
+import os
+import threading
+import concurrent.futures
+import numpy as np
+import glymur
+
+# 区域拆分模式
+SPLIT_MODES = ['auto', 'always']
+
+# 默认只拆分不小于此百万像素数的文件
+DEFAULT_MIN_MEGAPIXELS = 16.0
+
+# 未分块的码流按此行数对齐（常见的码块高度）
+UNTILED_ALIGNMENT = 64
+
+# 每个线程平均分到的区域数，多于1可以平衡各区域解码耗时的差异
+REGIONS_PER_WORKER = 2
+
+# 同一进程内所有文件共享的区域解码线程池（glymur解码时释放GIL），
+# 进程隔离模式下每个子进程各有一个
+_region_executor = None
+_region_executor_workers = None
+_region_executor_lock = threading.Lock()
+
+def _get_region_executor(workers):
+    global _region_executor, _region_executor_workers
+    with _region_executor_lock:
+        if _region_executor is None or _region_executor_workers != workers:
+            if _region_executor is not None:
+                _region_executor.shutdown(wait=False)
+            _region_executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            _region_executor_workers = workers
+        return _region_executor
+
+def plan_regions(header, workers):
+    """
+    把图像按行拆分为与码流分块对齐的水平条带
+    
+    对齐到分块边界后每个分块只被一个条带解码；未分块的码流按码块高度对齐
+    
+    返回:
+        [(起始行, 结束行)]
+    """
+    height = header['height']
+    tile_height = header['tile_height']
+    alignment = tile_height if 0 < tile_height < height else UNTILED_ALIGNMENT
+    
+    band_height = -(-height // (workers * REGIONS_PER_WORKER))
+    band_height = max(alignment, -(-band_height // alignment) * alignment)
+    return [(y0, min(y0 + band_height, height)) for y0 in range(0, height, band_height)]
+
+def _decode_band(input_path, y0, y1):
+    # 每个区域打开自己的Jp2k对象，glymur读取时会修改对象上的解码参数
+    return y0, glymur.Jp2k(input_path)[y0:y1, :]
+
+def decode_regions(input_path, header, workers=None, profiler=None):
+    """
+    把单个JP2文件拆分为多个区域并发解码，再拼接为完整栅格
+    
+    每个区域用glymur的窗口读取只解码覆盖该区域的分块，区域提交到共享线程池，
+    解码完成的区域立即拷贝到输出数组并释放
+    
+    参数:
+        input_path: 输入文件路径
+        header: read_jp2_header返回的文件头
+        workers: 区域解码的并发线程数，None表示CPU核心数
+        profiler: 正在分析本文件的WorkerProfiler，提供时各区域的解码也在池线程中分析
+    
+    返回:
+        与glymur.Jp2k(input_path)[:]相同的数组
+    """
+    workers = workers or os.cpu_count() or 1
+    regions = plan_regions(header, workers)
+    executor = _get_region_executor(workers)
+    if profiler is not None:
+        futures = [executor.submit(profiler.profile_task, _decode_band, input_path, y0, y1) for y0, y1 in regions]
+    else:
+        futures = [executor.submit(_decode_band, input_path, y0, y1) for y0, y1 in regions]
+    
+    data = None
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            y0, band = future.result()
+            if data is None:
+                # 通道数和数据类型取自第一个完成的区域
+                data = np.empty((header['height'],) + band.shape[1:], dtype=band.dtype)
+            data[y0:y0 + band.shape[0]] = band
+            del band
+    finally:
+        for future in futures:
+            future.cancel()
+    return data
+
+class RegionSplitPolicy:
+    """
+    决定哪些文件拆分为区域并发解码
+    
+    auto模式下，当一个大文件的像素数不少于剩余工作量（尚未完成的所有文件）按CPU核心平均分配的份额时拆分，
+    即剩余工作被少数大文件主导、整文件并行已无法占满所有核心时；always模式下拆分所有达到大小下限的文件
+    """
+    def __init__(self, header_index, mode='auto', min_megapixels=DEFAULT_MIN_MEGAPIXELS, cores=None, workers=None):
+        """
+        参数:
+            header_index: 文件头索引
+            mode: 拆分模式 (auto/always)
+            min_megapixels: 只拆分不小于此百万像素数的文件
+            cores: CPU核心数，None表示自动检测
+            workers: 区域解码的并发线程数，None表示CPU核心数
+        """
+        self.header_index = header_index
+        self.mode = mode
+        self.min_megapixels = min_megapixels
+        self.cores = cores or os.cpu_count() or 1
+        self.workers = workers or self.cores
+        self.split_files = 0
+        self.split_megapixels = 0.0
+        
+        self._lock = threading.Lock()
+        self._remaining = sum(header['megapixels'] for header in header_index.values() if header is not None)
+    
+    def _megapixels(self, input_path):
+        header = self.header_index.get(input_path)
+        return header['megapixels'] if header is not None else 0.0
+    
+    def should_split(self, input_path):
+        """文件开始处理前调用，返回是否拆分"""
+        megapixels = self._megapixels(input_path)
+        if megapixels < self.min_megapixels:
+            return False
+        with self._lock:
+            split = self.mode == 'always' or megapixels * self.cores >= self._remaining
+            if split:
+                self.split_files += 1
+                self.split_megapixels += megapixels
+        return split
+    
+    def finish(self, input_path):
+        """文件处理完成后调用，从剩余工作量中扣除"""
+        with self._lock:
+            self._remaining -= self._megapixels(input_path)
@@ -0,0 +1,254 @@
+import time
+import errno
+import threading
+import multiprocessing
+from jp2_profiler import WorkerProfiler
+
+# 视为临时性I/O错误、值得重试的errno
+TRANSIENT_ERRNOS = {
+    errno.EIO,
+    errno.EAGAIN,
+    errno.EBUSY,
+    errno.EINTR,
+    errno.ETIMEDOUT,
+    errno.ECONNRESET,
+    errno.ECONNABORTED,
+    errno.ENETDOWN,
+    errno.ENETUNREACH,
+    getattr(errno, 'ESTALE', errno.EIO),
+    getattr(errno, 'EREMOTEIO', errno.EIO),
+}
+
+# 错误分类
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+TIMEOUT = 'timeout'
+CRASHED = 'crashed'
+
+def classify_error(exc):
+    """
+    判断异常是临时性I/O错误（可重试）还是永久性错误（如文件损坏，应直接隔离）
+    
+    返回:
+        TRANSIENT 或 PERMANENT
+    """
+    if isinstance(exc, (FileNotFoundError, PermissionError, IsADirectoryError)):
+        return PERMANENT
+    if isinstance(exc, (TimeoutError, ConnectionError, InterruptedError, BlockingIOError)):
+        return TRANSIENT
+    if isinstance(exc, OSError) and exc.errno in TRANSIENT_ERRNOS:
+        return TRANSIENT
+    return PERMANENT
+
+def _child_main(conn):
+    """子进程主循环：接收任务、执行并返回结果，收到None时退出"""
+    # 通知父进程启动完成，进程启动和模块导入的耗时不计入任务超时
+    conn.send('ready')
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        
+        func, args, profile = message
+        # 用WorkerProfiler而不是单个cProfile，任务提交到子进程内线程池的部分也能被分析
+        profiler = WorkerProfiler() if profile else None
+        try:
+            if profiler is not None:
+                result = profiler.profile_call(func, *args)
+            else:
+                result = func(*args)
+            reply = ('ok', result, None)
+        except Exception as e:
+            reply = ('error', classify_error(e), str(e))
+        
+        stats = None
+        if profiler is not None:
+            merged = profiler.merged_stats()
+            stats = merged.stats if merged is not None else None
+        conn.send(reply + (stats,))
+
+class IsolatedWorker:
+    """
+    在独立子进程中执行任务
+    
+    与线程不同，子进程在解码卡死时可以被强制终止，终止后下次调用会自动重新创建
+    """
+    def __init__(self, context):
+        self.context = context
+        self.process = None
+        self.conn = None
+    
+    def start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=_child_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.conn.recv()
+    
+    def run(self, func, args, timeout, profile=False):
+        """
+        在子进程中执行func(*args)
+        
+        返回:
+            ('ok', 结果, 统计) 或 ('error', 错误分类, 错误信息, 统计)，
+            超时返回(TIMEOUT, ...)，子进程崩溃返回(CRASHED, ...)
+        """
+        try:
+            if self.process is None or not self.process.is_alive():
+                self.start()
+            self.conn.send((func, args, profile))
+        except (EOFError, OSError):
+            # 子进程启动失败或在接收任务前退出
+            return self._crashed()
+        
+        if not self.conn.poll(timeout):
+            self.kill()
+            return ('error', TIMEOUT, f"处理超时 (>{timeout:.1f}秒)，已终止工作进程", None)
+        
+        try:
+            return self.conn.recv()
+        except (EOFError, OSError):
+            return self._crashed()
+    
+    def _crashed(self):
+        # 管道断开时子进程可能尚未被回收，先等待其退出再读取退出码
+        exitcode = None
+        if self.process is not None and self.process.pid is not None:
+            self.process.join(1)
+            exitcode = self.process.exitcode
+        self.kill()
+        return ('error', CRASHED, f"工作进程异常退出 (退出码: {exitcode})", None)
+    
+    def kill(self):
+        """强制终止子进程"""
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(1)
+                if self.process.is_alive():
+                    self.process.kill()
+                    self.process.join()
+            if self.conn is not None:
+                self.conn.close()
+        self.process = None
+        self.conn = None
+    
+    def stop(self):
+        """通知子进程正常退出"""
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(None)
+                self.process.join(1)
+            except OSError:
+                pass
+        self.kill()
+
+class TaskRunner:
+    """
+    按错误类型执行转换任务：临时性I/O错误按指数退避重试，
+    永久性错误、超时和崩溃直接加入隔离列表
+    
+    设置timeout后，每个工作线程绑定一个可终止的子进程，任务在子进程中执行
+    """
+    def __init__(self, func, timeout=None, deadline_fn=None, retries=2, backoff=0.5, profiler=None, on_success=None):
+        """
+        参数:
+            func: 转换函数，参数为任务元组，失败时抛出异常
+            timeout: 单个文件的超时秒数，None表示在当前线程中执行、不设超时
+            deadline_fn: 根据输入路径计算超时秒数的函数，未提供时统一使用timeout
+            retries: 临时性错误的最大重试次数
+            backoff: 首次重试前的等待秒数，之后每次翻倍
+            profiler: WorkerProfiler实例
+            on_success: 任务成功时以转换函数的返回值调用
+        """
+        self.func = func
+        self.timeout = timeout
+        self.deadline_fn = deadline_fn
+        self.retries = retries
+        self.backoff = backoff
+        self.profiler = profiler
+        self.on_success = on_success
+        self.retried = 0
+        self.quarantine = []
+        
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._workers = []
+        self._context = multiprocessing.get_context('spawn')
+    
+    def _get_worker(self):
+        worker = getattr(self._local, 'worker', None)
+        if worker is None:
+            worker = self._local.worker = IsolatedWorker(self._context)
+            with self._lock:
+                self._workers.append(worker)
+        return worker
+    
+    def _call_local(self, task):
+        try:
+            if self.profiler is not None:
+                result = self.profiler.profile_call(self.func, *task)
+            else:
+                result = self.func(*task)
+            return ('ok', result)
+        except Exception as e:
+            return ('error', classify_error(e), str(e))
+    
+    def _call_isolated(self, task):
+        timeout = self.deadline_fn(task[0]) if self.deadline_fn else self.timeout
+        profile = self.profiler is not None and self.profiler.should_sample()
+        reply = self._get_worker().run(self.func, task, timeout, profile)
+        if reply[-1] is not None:
+            self.profiler.add_stats(reply[-1])
+        return reply[:-1]
+    
+    def run(self, task):
+        """
+        执行单个任务
+        
+        返回:
+            (成功标志, 输入路径, 输出路径, 错误信息)
+        """
+        input_path, output_path = task[0], task[1]
+        attempt = 0
+        while True:
+            if self.timeout is None:
+                reply = self._call_local(task)
+            else:
+                reply = self._call_isolated(task)
+            
+            if reply[0] == 'ok':
+                if self.on_success is not None:
+                    self.on_success(reply[1])
+                return (True, input_path, output_path, None)
+            
+            kind, error = reply[1], reply[2]
+            if kind == TRANSIENT and attempt < self.retries:
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+                with self._lock:
+                    self.retried += 1
+                continue
+            
+            if kind != TRANSIENT:
+                with self._lock:
+                    self.quarantine.append((input_path, kind, error))
+            return (False, input_path, output_path, error)
+    
+    def write_quarantine(self, path):
+        """把隔离列表写入文件（每行: 输入路径\\t分类\\t错误信息）"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for input_path, kind, error in self.quarantine:
+                f.write(f"{input_path}\t{kind}\t{error}\n")
+    
+    def shutdown(self):
+        """终止所有工作子进程"""
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
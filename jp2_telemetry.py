@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import threading
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，相关指标记为None
+    resource = None
+
+def _maxrss_bytes(usage):
+    # ru_maxrss在Linux上以KB为单位，在macOS上以字节为单位
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+def current_rss():
+    """
+    当前进程的常驻内存字节数
+    
+    优先读取/proc/self/statm，不可用时退化为峰值RSS，都不可用时返回None
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        return _maxrss_bytes(resource.getrusage(resource.RUSAGE_SELF))
+    return None
+
+def read_io_counters():
+    """
+    读取/proc/self/io中的实际读写字节数（包含已回收的子进程）
+    
+    返回:
+        (读取字节数, 写入字节数)，不支持时为(None, None)
+    """
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key] = int(value)
+    except (OSError, ValueError):
+        return None, None
+    return counters.get('read_bytes'), counters.get('write_bytes')
+
+def read_resource_usage():
+    """
+    汇总本进程及已回收子进程的资源使用情况
+    
+    返回:
+        包含peak_rss、children_peak_rss、cpu_user、cpu_system、io_read、io_write的字典，
+        平台不支持的指标为None
+    """
+    usage = {
+        'peak_rss': None,
+        'children_peak_rss': None,
+        'cpu_user': None,
+        'cpu_system': None,
+    }
+    if resource is not None:
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage['peak_rss'] = _maxrss_bytes(self_usage)
+        usage['children_peak_rss'] = _maxrss_bytes(children_usage)
+        usage['cpu_user'] = self_usage.ru_utime + children_usage.ru_utime
+        usage['cpu_system'] = self_usage.ru_stime + children_usage.ru_stime
+    else:
+        times = os.times()
+        usage['cpu_user'] = times.user + times.children_user
+        usage['cpu_system'] = times.system + times.children_system
+    
+    usage['io_read'], usage['io_write'] = read_io_counters()
+    return usage
+
+def usage_delta(start, end):
+    """计算两次read_resource_usage之间的CPU和I/O增量，峰值内存取结束时的值"""
+    delta = dict(end)
+    for key in ['cpu_user', 'cpu_system', 'io_read', 'io_write']:
+        if start.get(key) is not None and end.get(key) is not None:
+            delta[key] = end[key] - start[key]
+    return delta
+
+def estimate_file_memory(header, resize=None, raw=False):
+    """
+    估算转换单个文件的峰值内存分配
+    
+    包括解码后的数组、由数组构造的PIL图像（原始栅格格式不需要），
+    以及LANCZOS调整大小时的中间图像（先水平后垂直两遍）和输出图像
+    
+    返回:
+        估算字节数
+    """
+    itemsize = 1 if header['bitdepth'] <= 8 else 2
+    pixel_bytes = header['components'] * itemsize
+    decoded = header['width'] * header['height'] * pixel_bytes
+    
+    total = decoded if raw else decoded * 2
+    if resize:
+        width, height = resize
+        total += width * header['height'] * pixel_bytes
+        total += width * height * pixel_bytes
+    return total
+
+class MemoryGovernor:
+    """
+    按内存上限节流：启动新文件前，若基线内存 + 正在处理文件的估算内存 + 新文件估算内存
+    超过上限（或当前RSS已超过上限），则等待其他文件完成
+    
+    至少允许一个文件在处理，保证单个超大文件也能继续执行
+    """
+    def __init__(self, max_rss):
+        """
+        参数:
+            max_rss: 内存上限字节数
+        """
+        self.max_rss = max_rss
+        self.baseline = current_rss() or 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        self._reserved = 0
+        self._active = 0
+        self._cond = threading.Condition()
+    
+    def _fits(self, estimate):
+        if self._active == 0:
+            return True
+        if self.baseline + self._reserved + estimate > self.max_rss:
+            return False
+        rss = current_rss()
+        return rss is None or rss <= self.max_rss
+    
+    def acquire(self, estimate):
+        with self._cond:
+            if not self._fits(estimate):
+                self.throttled += 1
+                start = time.perf_counter()
+                # RSS会在其他线程释放内存后异步下降，因此定期重新检查
+                while not self._fits(estimate):
+                    self._cond.wait(0.5)
+                self.waited_seconds += time.perf_counter() - start
+            self._reserved += estimate
+            self._active += 1
+    
+    def release(self, estimate):
+        with self._cond:
+            self._reserved -= estimate
+            self._active -= 1
+            self._cond.notify_all()
+
+def format_bytes(value):
+    """格式化字节数为MB文字，平台不支持的指标（None）显示为未知"""
+    return "未知" if value is None else f"{value / 1024 / 1024:.1f} MB"
+
+def format_usage(usage):
+    """把资源使用情况格式化为一行文字"""
+    cpu = "未知"
+    if usage['cpu_user'] is not None:
+        cpu = f"用户 {usage['cpu_user']:.2f}秒 / 系统 {usage['cpu_system']:.2f}秒"
+    return (f"资源: 峰值RSS {format_bytes(usage['peak_rss'])} (子进程 {format_bytes(usage['children_peak_rss'])}), "
+            f"CPU {cpu}, 读取 {format_bytes(usage['io_read'])}, 写入 {format_bytes(usage['io_write'])}")
+
+def write_report(report_path, report):
+    """写出JSON格式的运行报告"""
+    report_dir = os.path.dirname(report_path)
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,111 @@
+import os
+import json
+import threading
+import concurrent.futures
+
+# 列表缓存文件格式版本
+CACHE_VERSION = 1
+
+def scan_directory(path, suffix='.jp2'):
+    """
+    列出单个目录
+    
+    使用scandir返回的d_type区分目录和文件，普通条目不需要额外的stat调用
+    
+    返回:
+        (目录mtime纳秒, 子目录名列表, 匹配后缀的文件名列表)
+    """
+    # 先记录mtime再列出目录，列出期间目录发生变化时下次运行会重新列出
+    mtime = os.stat(path).st_mtime_ns
+    dirs = []
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif entry.name.lower().endswith(suffix) and entry.is_file():
+                    files.append(entry.name)
+            except OSError:
+                continue
+    dirs.sort()
+    files.sort()
+    return mtime, dirs, files
+
+def load_listing_cache(cache_path, suffix='.jp2'):
+    """
+    读取目录列表缓存
+    
+    返回:
+        {目录路径: [mtime纳秒, 子目录名列表, 文件名列表]}，缓存不存在或不匹配时返回空字典
+    """
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != CACHE_VERSION or data.get('suffix') != suffix:
+        return {}
+    return data.get('dirs', {})
+
+def save_listing_cache(cache_path, listing, suffix='.jp2'):
+    """写出目录列表缓存（先写临时文件再替换，避免中断时损坏）"""
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'suffix': suffix, 'dirs': listing}, f, ensure_ascii=False)
+    os.replace(temp_path, cache_path)
+
+def walk_directory(top, recursive=True, max_workers=32, cache_path=None, suffix='.jp2'):
+    """
+    并发遍历目录树，同时列出多个目录以减少网络文件系统上的往返等待
+    
+    参数:
+        top: 根目录
+        recursive: 是否递归处理子目录
+        max_workers: 同时列出目录的最大线程数
+        cache_path: 目录列表缓存文件路径，目录mtime未变化时直接复用缓存中的列表
+        suffix: 只收集此后缀的文件
+    
+    返回:
+        ([(目录路径, 子目录名列表, 文件名列表)]按路径排序, {'listed': 重新列出的目录数, 'cached': 复用缓存的目录数})
+    """
+    cache = load_listing_cache(cache_path, suffix) if cache_path else {}
+    listing = {}
+    stats = {'listed': 0, 'cached': 0}
+    lock = threading.Lock()
+    
+    def visit(path):
+        cached = cache.get(path)
+        if cached is not None:
+            # 只stat一次目录，mtime未变化时复用缓存
+            try:
+                if os.stat(path).st_mtime_ns == cached[0]:
+                    with lock:
+                        stats['cached'] += 1
+                    return path, cached
+            except OSError:
+                pass
+        entry = list(scan_directory(path, suffix))
+        with lock:
+            stats['listed'] += 1
+        return path, entry
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(visit, top)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    path, entry = future.result()
+                except OSError:
+                    continue
+                listing[path] = entry
+                if recursive:
+                    pending |= {executor.submit(visit, os.path.join(path, name)) for name in entry[1]}
+    
+    if cache_path:
+        # 非递归时只列出了根目录，保留缓存中其余目录的列表
+        save_listing_cache(cache_path, listing if recursive else {**cache, **listing}, suffix)
+    
+    walk = [(path, entry[1], entry[2]) for path, entry in sorted(listing.items())]
+    return walk, stats